@@ -1,17 +1,40 @@
 from . import vector as vec
 
+# Most tiles are empty, so they all share this (immutable) empty tuple until something gets added.
+# `Tile.add` swaps in a list of the tile's own, so anything else adding contents should go through it too.
+NO_CONTENTS = ()
+
 class Tile:
+    __slots__ = ('contents',)
     def __init__(self):
-        self.contents = []
+        self.contents = NO_CONTENTS
     def add(self, ent):
-        self.contents.append(ent)
+        if self.contents is NO_CONTENTS:
+            self.contents = [ent]
+        else:
+            self.contents.append(ent)
     def rm(self, ent):
         self.contents.remove(ent)
+        if not self.contents:
+            self.contents = NO_CONTENTS
+
+# Same idea as `NO_CONTENTS`
+NO_WATCHERS = ()
 
 class WatchyTile(Tile):
+    __slots__ = ('watchers',)
     def __init__(self):
         super().__init__()
-        self.watchers = []
+        self.watchers = NO_WATCHERS
+    def add_watcher(self, l):
+        if self.watchers is NO_WATCHERS:
+            self.watchers = [l]
+        else:
+            self.watchers.append(l)
+    def rm_watcher(self, l):
+        self.watchers.remove(l)
+        if not self.watchers:
+            self.watchers = NO_WATCHERS
     def add(self, ent):
         super().add(ent)
         self.handle_activity(ent)
@@ -19,6 +42,8 @@ class WatchyTile(Tile):
         super().rm(ent)
         self.handle_activity(ent)
     def handle_activity(self, ent):
+        if not self.watchers:
+            return
         # tile_update() sometimes cleans up watchers (while we're iterating it!),
         # so we have to make a quick dupe
         for l in self.watchers.copy():
@@ -49,25 +74,55 @@ class Board:
         self.max_x = None
         self.max_y = None
 
+        # Nobody knows what changed, since everything did
+        self.dirty = None
+
+    def mark_dirty(self, pos):
+        # Only tracked once somebody has started asking for it (see `take_dirty`)
+        if self.dirty is not None:
+            self.dirty.add(pos)
+
+    def take_dirty(self):
+        """
+        Returns the set of positions marked dirty since the last call,
+        or `None` if that isn't known (e.g. the board was just reset).
+        """
+        ret = self.dirty
+        self.dirty = set()
+        return ret
+
+    def items(self):
+        "Yields (pos, tile) for every allocated tile"
+        if self.tile_offset is None:
+            return
+        (off_x, off_y) = self.tile_offset
+        for x in range(len(self.board)):
+            col = self.board[x]
+            for y in range(len(col)):
+                if col[y] is not None:
+                    yield ((x + off_x, y + off_y), col[y])
+
     def get_tile(self, pos):
         if self.min_x == None:
             return self.filler
-        (x, y) = vec.sub(pos, self.tile_offset)
+        x = pos[0] - self.tile_offset[0]
+        y = pos[1] - self.tile_offset[1]
         if x < 0 or x >= len(self.board):
             return self.filler
         row = self.board[x]
         if y < 0 or y >= len(row):
             return self.filler
-        return row[y]
+        tile = row[y]
+        if tile is None:
+            return self.filler
+        return tile
 
-    def require_tile(self, pos):
+    def _track_bounds(self, pos):
         if self.min_x == None:
             self.min_x = pos[0]
             self.max_x = pos[0] + 1
             self.min_y = pos[1]
             self.max_y = pos[1] + 1
-            if self.tile_offset == None:
-                self.tile_offset = pos
         else:
             if pos[0] < self.min_x:
                 self.min_x = pos[0]
@@ -78,26 +133,193 @@ class Board:
             elif pos[1] >= self.max_y:
                 self.max_y = pos[1] + 1
 
+    def require_tile(self, pos):
+        self._track_bounds(pos)
+        if self.tile_offset == None:
+            self.tile_offset = pos
+
         (x, y) = vec.sub(pos, self.tile_offset)
         width = len(self.board)
         height = len(self.board[0])
+        # Whenever we have to expand, we at least double in that direction,
+        # so a board growing steadily at its edges only rarely has to copy.
+        # The new space is only filled with `None`s, so it's cheap to have lots of it.
         if x < 0:
-            self.tile_offset = (pos[0], self.tile_offset[1])
-            self.board = [self.mk_tile_list(height) for i in range(-x)] + self.board
-            x = 0
+            amt = max(-x, width)
+            self.tile_offset = (self.tile_offset[0] - amt, self.tile_offset[1])
+            self.board[0:0] = [[None] * height for i in range(amt)]
+            x += amt
         elif x >= width:
-            self.board += [self.mk_tile_list(height) for i in range(x - width + 1)]
+            amt = max(x - width + 1, width)
+            self.board += [[None] * height for i in range(amt)]
         if y < 0:
-            self.tile_offset = (self.tile_offset[0], pos[1])
-            amt = -y
-            for i in range(len(self.board)): # Cannot use 'width' here, possibly invalidated by x-axis expansion
-                self.board[i] = self.mk_tile_list(amt) + self.board[i]
-            y = 0
+            amt = max(-y, height)
+            self.tile_offset = (self.tile_offset[0], self.tile_offset[1] - amt)
+            padding = [None] * amt
+            for col in self.board: # Cannot use 'width' here, possibly invalidated by x-axis expansion
+                col[0:0] = padding
+            y += amt
         elif y >= height:
-            amt = y - height + 1
+            padding = [None] * max(y - height + 1, height)
             for col in self.board:
-                col += self.mk_tile_list(amt)
-        return self.board[x][y]
+                col += padding
+        col = self.board[x]
+        tile = col[y]
+        if tile is None:
+            tile = self.tile_type()
+            col[y] = tile
+        return tile
 
     def mk_tile_list(self, n):
         return [self.tile_type() for i in range(n)]
+
+class ByteGrid:
+    """
+    Growable rectangle of bytes, one per position, for compact flags about a board.
+    Reading anywhere outside it gives `default`.
+    """
+    def __init__(self, default=0):
+        self.default = default
+        self.offset = (0, 0)
+        self.width = 0
+        self.height = 0
+        self.data = bytearray()
+
+    def get(self, pos):
+        x = pos[0] - self.offset[0]
+        y = pos[1] - self.offset[1]
+        if x < 0 or y < 0 or x >= self.width or y >= self.height:
+            return self.default
+        return self.data[x * self.height + y]
+
+    def set(self, pos, value):
+        x = pos[0] - self.offset[0]
+        y = pos[1] - self.offset[1]
+        if x < 0 or y < 0 or x >= self.width or y >= self.height:
+            self._grow(pos)
+            x = pos[0] - self.offset[0]
+            y = pos[1] - self.offset[1]
+        self.data[x * self.height + y] = value
+
+    def bounds(self):
+        "(min_x, min_y, max_x, max_y), same as `Board` keeps"
+        return (self.offset[0], self.offset[1], self.offset[0] + self.width, self.offset[1] + self.height)
+
+    def copy(self):
+        ret = ByteGrid(self.default)
+        ret.offset = self.offset
+        ret.width = self.width
+        ret.height = self.height
+        ret.data = self.data[:]
+        return ret
+
+    def _grow(self, pos):
+        if self.width == 0:
+            (min_x, min_y) = pos
+            (max_x, max_y) = (pos[0] + 1, pos[1] + 1)
+        else:
+            # Same as `Board.require_tile`, at least double in whatever direction we grow
+            (min_x, min_y, max_x, max_y) = self.bounds()
+            if pos[0] < min_x:
+                min_x -= max(min_x - pos[0], self.width)
+            elif pos[0] >= max_x:
+                max_x += max(pos[0] - max_x + 1, self.width)
+            if pos[1] < min_y:
+                min_y -= max(min_y - pos[1], self.height)
+            elif pos[1] >= max_y:
+                max_y += max(pos[1] - max_y + 1, self.height)
+        width = max_x - min_x
+        height = max_y - min_y
+        data = bytearray([self.default]) * (width * height)
+        dx = self.offset[0] - min_x
+        dy = self.offset[1] - min_y
+        for x in range(self.width):
+            start = (x + dx) * height + dy
+            data[start:start + self.height] = self.data[x * self.height:(x + 1) * self.height]
+        self.offset = (min_x, min_y)
+        self.width = width
+        self.height = height
+        self.data = data
+
+# Chunks are CHUNK_SIZE tiles on a side
+CHUNK_BITS = 4
+CHUNK_SIZE = 1 << CHUNK_BITS
+CHUNK_MASK = CHUNK_SIZE - 1
+
+class ChunkedBoard(Board):
+    """
+    Sparse Board, keeping tiles in square chunks keyed by chunk coordinate.
+    Chunks are only allocated once something requires a tile in them,
+    so memory (and `items()`) goes with the area actually in use
+    rather than its bounding box.
+    """
+    def __init__(self, tile_offset=None, width=1, height=1, tile_type=Tile):
+        super().__init__(tile_offset, width, height, tile_type)
+
+    def reset(self, tile_offset=(0,0), width=1, height=1):
+        """
+        As with `Board.reset`, this allocates a new board, and if
+        `tile_offset` is given the tiles in that rectangle up front.
+        """
+        self.tile_offset = tile_offset
+        self.chunks = {}
+        if tile_offset is not None:
+            for x in range(width):
+                for y in range(height):
+                    self._alloc((tile_offset[0] + x, tile_offset[1] + y))
+
+        self.min_x = None
+        self.min_y = None
+        self.max_x = None
+        self.max_y = None
+
+        self.dirty = None
+
+    def items(self):
+        "Yields (pos, tile) for every allocated tile, a chunk at a time"
+        for (cx, cy), chunk in self.chunks.items():
+            base_x = cx << CHUNK_BITS
+            base_y = cy << CHUNK_BITS
+            for i in range(len(chunk)):
+                if chunk[i] is not None:
+                    yield ((base_x + (i >> CHUNK_BITS), base_y + (i & CHUNK_MASK)), chunk[i])
+
+    def get_tile(self, pos):
+        chunk = self.chunks.get((pos[0] >> CHUNK_BITS, pos[1] >> CHUNK_BITS))
+        if chunk is None:
+            return self.filler
+        tile = chunk[(pos[0] & CHUNK_MASK) << CHUNK_BITS | (pos[1] & CHUNK_MASK)]
+        if tile is None:
+            return self.filler
+        return tile
+
+    def require_tile(self, pos):
+        self._track_bounds(pos)
+        return self._alloc(pos)
+
+    def _alloc(self, pos):
+        key = (pos[0] >> CHUNK_BITS, pos[1] >> CHUNK_BITS)
+        chunk = self.chunks.get(key)
+        if chunk is None:
+            chunk = [None] * (CHUNK_SIZE * CHUNK_SIZE)
+            self.chunks[key] = chunk
+        ix = (pos[0] & CHUNK_MASK) << CHUNK_BITS | (pos[1] & CHUNK_MASK)
+        tile = chunk[ix]
+        if tile is None:
+            tile = self.tile_type()
+            chunk[ix] = tile
+        return tile
+
+def changed_positions(old, new):
+    "Compares the contents of two boards, returning the set of positions that differ"
+    ret = set()
+    for board in (old, new):
+        for pos, _ in board.items():
+            if pos in ret:
+                continue
+            old_contents = old.get_tile(pos).contents
+            new_contents = new.get_tile(pos).contents
+            # Empty is empty, whether it's `NO_CONTENTS` or a list
+            if (old_contents or new_contents) and old_contents != new_contents:
+                ret.add(pos)
+    return ret
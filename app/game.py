@@ -1,6 +1,15 @@
 from .board import *
 from .common import *
 from . import tasks
+from itertools import count
+from collections import deque
+
+# Shared between all games, so a snapshot generation
+# is never mistaken for one from some other game
+snapshot_gens = count(1)
+# How many snapshots back we remember what changed,
+# for players whose frames don't happen every step
+SNAPSHOT_HISTORY = 16
 
 # Minimal impl of a Game, no amenities or bells and whistles
 class BareGame:
@@ -21,15 +30,73 @@ class BareGame:
         pass
 
 class Game(BareGame):
-    def __init__(self, *a, tile_type = WatchyTile, **ka):
+    # Whether `draw_to_board` only draws each ent into its own tile,
+    # which lets us redraw just the dirty tiles between steps.
+    # Subclasses that draw anything more interesting should turn this off.
+    incremental_draw = True
+    def __init__(self, *a, tile_type = WatchyTile, board_type = Board, **ka):
         super().__init__(*a, **ka)
         self.characters = []
-        self.board = Board(tile_type = tile_type)
+        self.board = board_type(tile_type = tile_type)
+        self.snapshot = ChunkedBoard()
+        self.snapshot_gen = next(snapshot_gens)
+        # (previous gen, gen, positions which changed between them)
+        self.snapshot_history = deque(maxlen = SNAPSHOT_HISTORY)
+        self.snapshot_stale = True
     def seat_player(self, player):
         self.characters.append(Character(self, player))
     def process_command(self, char, cmd):
         raise PebkacException(f"Unknown command '{cmd.split()[0]}'")
+    def draw_to_board(self, out_board):
+        for _, cell in self.board.items():
+            for ent in cell.contents:
+                ent.draw(out_board)
+    def get_snapshot(self):
+        """
+        Returns a Board of sprite names drawn from the shared game state.
+        This is only drawn once per step, and is shared between all the
+        characters' frames. Tiles' contents lists are replaced rather than
+        modified when redrawn, so nobody else should be writing to them.
+        """
+        if self.snapshot_stale:
+            self.snapshot_stale = False
+            prev_gen = self.snapshot_gen
+            self.snapshot_gen = next(snapshot_gens)
+            dirty = self.board.take_dirty()
+            if dirty is None or not self.incremental_draw:
+                old = self.snapshot
+                self.snapshot = ChunkedBoard()
+                self.draw_to_board(self.snapshot)
+                dirty = changed_positions(old, self.snapshot)
+            else:
+                for pos in dirty:
+                    cell = self.board.get_tile(pos)
+                    tile = self.snapshot.get_tile(pos)
+                    if tile is self.snapshot.filler:
+                        if not cell.contents:
+                            continue
+                        tile = self.snapshot.require_tile(pos)
+                    tile.contents = NO_CONTENTS
+                    for ent in cell.contents:
+                        ent.draw(self.snapshot)
+            self.snapshot_history.append((prev_gen, self.snapshot_gen, dirty))
+        return self.snapshot
+    def dirty_since(self, gen):
+        """
+        Returns the set of positions that changed in the snapshot since generation `gen`,
+        or `None` if that's too far back (or not one of ours).
+        """
+        ret = set()
+        if gen == self.snapshot_gen:
+            return ret
+        for prev_gen, _, dirty in reversed(self.snapshot_history):
+            ret |= dirty
+            if prev_gen == gen:
+                return ret
+        return None
     def step_complete(self):
+        # Public state may have changed, so the old snapshot is no good
+        self.snapshot_stale = True
         for c in self.characters:
             c.step_complete()
 
@@ -49,16 +116,16 @@ class Character:
             p.set_char(self)
     def step_complete(self):
         if self.player != None:
-            self.player.do_frame()
+            self.player.request_frame()
     def draw_to_board(self, out_board):
-        # Access entire raw board, ignoring coords
-        for col in self.game.board.board:
-            for cell in col:
-                for ent in cell.contents:
-                    ent.draw(out_board)
+        # Only for stuff specific to this character (selections etc),
+        # which is drawn on top of the game's shared snapshot
         return self.layout
 
 class Ent:
+    # There can be an awful lot of these, so they're kept compact.
+    # Subclasses that only make a few can skip `__slots__`.
+    __slots__ = ('game', 'board', 'pos')
     def __init__(self, game):
         self.game = game
         self.board = game.board
@@ -74,11 +141,18 @@ class Ent:
     def _move(self, pos):
         if self.pos is not None:
             self.board.get_tile(self.pos).rm(self)
+            self.board.mark_dirty(self.pos)
         if pos is not None:
             self.board.require_tile(pos).add(self)
+            self.board.mark_dirty(pos)
         self.pos = pos
+    def _redraw(self):
+        # For when the way an ent draws changes without it moving
+        if self.pos is not None:
+            self.board.mark_dirty(self.pos)
 
 class SpriteEnt(Ent):
+    __slots__ = ('sprite',)
     def __init__(self, sprite, *a, **kwa):
         self.sprite = sprite
         super().__init__(*a, **kwa)
@@ -87,6 +161,7 @@ class SpriteEnt(Ent):
             out_board.require_tile(self.pos).add(self.sprite)
 
 class WatchedEnt(Ent):
+    # No `__slots__`, since some subclasses are also `SpriteEnt`s
     def __init__(self, *a, **kwa):
         self.watchers = []
         super().__init__(*a, **kwa)
@@ -108,10 +183,12 @@ class WriteOp:
     Basically just an operation that writes public state
     and needs to be careful to not muck things up
     """
+    __slots__ = ()
     def sched(self, q):
         q.schedule(self._run, 0, tasks.WRITE_PATIENCE)
 
 class Move(WriteOp):
+    __slots__ = ('ent', 'pos')
     def __init__(self, ent, pos):
         self.ent = ent
         self.pos = pos
@@ -119,12 +196,14 @@ class Move(WriteOp):
         self.ent._move(self.pos)
 
 class Destroy(WriteOp):
+    __slots__ = ('ent',)
     def __init__(self, ent):
         self.ent = ent
     def _run(self):
         self.ent._destroy()
 
 class WriteAll(WriteOp):
+    __slots__ = ('args',)
     def __init__(self, *a):
         self.args = a
     def _run(self):
@@ -132,6 +211,7 @@ class WriteAll(WriteOp):
             a._run()
 
 class WithClaim(WriteOp):
+    __slots__ = ('game', 'pos', 'op', 'tok', 'success')
     def __init__(self, game, pos, op):
         self.game = game
         self.pos = pos
@@ -150,6 +230,7 @@ class WithClaim(WriteOp):
 # Eventually these may be more complex, e.g. a heirarchy of "stronger" tokens / claiming different aspects of the tile,
 # but for now just making sure nobody else is interested in the tile is enough.
 class ClaimToken(Ent):
+    __slots__ = ('valid',)
     def __init__(self, *a, **kwa):
         super().__init__(*a, **kwa)
         self.valid = True
@@ -7,8 +7,11 @@ layout = (50, 43, 25, 7, 'hex_empty')
 
 class GrowGame(Game):
     def __init__(self, *a, **kwa):
-        super().__init__(*a, **kwa)
-        self.task_queue = tasks.MillisTaskQueue(self.step_complete)
+        # Players can build land anywhere, so the board could get very spread out
+        super().__init__(*a, board_type = ChunkedBoard, **kwa)
+        # Nobody can tell if a plant grows a few millis late,
+        # so batch things up rather than waking up for every single one
+        self.task_queue = tasks.TickTaskQueue(self.step_complete)
     async def cleanup(self):
         await self.task_queue.cancel()
     def seat_player(self, player):
@@ -74,6 +77,7 @@ class GrowCharacter(Character):
         return super().draw_to_board(out_board)
 
 class MagentaPlant(Ent):
+    __slots__ = ('delay', 'stage')
     def __init__(self, delay, *a, **kwa):
         super().__init__(*a, **kwa)
         self.delay = delay
@@ -85,5 +89,6 @@ class MagentaPlant(Ent):
         if self.game == None:
             return
         self.stage += 1
+        self._redraw()
         if self.stage < 3:
             self.game.task_queue.schedule(self.grow, self.delay, tasks.NO_PATIENCE)
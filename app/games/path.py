@@ -442,4 +442,4 @@ class PathCharacter(Character):
 
 # Just a subclass we use with `isinstance`, no code difference
 class SolidEnt(SpriteEnt):
-    pass
+    __slots__ = ()
@@ -1,6 +1,6 @@
-from .. import board, wait, tasks, vector as vec
+from .. import board, wait, tasks, offload, vector as vec
 from ..game import *
-from ..line_of_sight import los_fill
+from ..line_of_sight import los_fill_many, merge_visibility
 from ..path_planning import update_path
 import math
 from random import Random
@@ -15,12 +15,35 @@ class Opt:
 # Actual list of `Opt`s has to be defined after `SalvageGame`,
 # since `handler`s are functions on `SalvageGame`.
 
+# How far eyeballs can see, or `None` for as far as there's board
+SIGHT_RADIUS = None
+
+def visibility(clear, sources):
+    """
+    Line-of-sight from each of `sources`, where `clear` is a `ByteGrid` of what can be seen through.
+    Returns a dict of each source to a dict of positions to visibility.
+    This only looks at its arguments, so it's safe to run off the event loop (see `offload`).
+    """
+    return los_fill_many(lambda pos: not clear.get(pos), sources, SIGHT_RADIUS, clear.bounds())
+
 class SalvageGame(Game):
+    # We draw based on visibility, not just what's on the board
+    incremental_draw = False
     def __init__(self, *a, **kwa):
         super().__init__(*a, tile_type=Tile, **kwa)
+        self.visible_spaces = {}
+        self.los = offload.Offloader()
+        # Eyeball position -> its visible positions, for the current `opacity_version`.
+        # Only the opacity of the positions in an LOS went into calculating it,
+        # so each entry stays good until one of those changes.
+        self.los_cache = {}
+        self.opacity_version = 0
+        self.opacity_changes = set()
+        # What can be seen through (and walked on), kept up to date by `Terrain`
+        self.clear = board.ByteGrid()
         for y in range(0, 7):
             for x in range(-(y//2), 8 + (-y//2)):
-                SpriteEnt("grass", self)._move((x,y))
+                Terrain("grass", False, self)._move((x,y))
         for o in options.values():
             o.handler(self, o.default)
         self.phase_armed = False
@@ -58,10 +81,45 @@ class SalvageGame(Game):
             self.phase_armed = False
             self.complete_phase()
         self.lobby.broadcast("5x phases occurred in rapid succession, aborting to prevent loop")
+    async def cleanup(self):
+        self.los.cancel()
+    def terrain_changed(self, pos):
+        terrain = [e for e in self.board.get_tile(pos).contents if isinstance(e, Terrain)]
+        clear = int(len(terrain) > 0 and not any(e.opaque for e in terrain))
+        if clear != self.clear.get(pos):
+            self.clear.set(pos, clear)
+            self.opacity_changes.add(pos)
     def step_complete(self):
-        self.visible_spaces = {}
-        for c in self.characters:
-            c.do_los()
+        sources = [e.pos for c in self.characters for e in c.eyeballs]
+        keep = set(sources)
+        if self.opacity_changes:
+            changes = self.opacity_changes
+            self.opacity_changes = set()
+            self.opacity_version += 1
+            self.los_cache = {k: v for k, v in self.los_cache.items() if k in keep and changes.isdisjoint(v)}
+        else:
+            self.los_cache = {k: v for k, v in self.los_cache.items() if k in keep}
+        missing = [src for src in keep if src not in self.los_cache]
+        version = self.opacity_version
+        apply = lambda results: self.los_done(sources, version, results)
+        # Frames wait for the LOS, which might not happen right away.
+        # Until then, everyone keeps seeing (and planning with) the old visibility.
+        if missing:
+            self.los.submit(visibility, (self.clear.copy(), missing), apply)
+        else:
+            self.los.skip({}, apply)
+    def los_done(self, sources, version, results):
+        if version == self.opacity_version:
+            self.los_cache.update(results)
+        # Otherwise these are already out of date, and there's a newer LOS on the way.
+        # Still worth showing in the meantime though.
+        visible = {}
+        for src in sources:
+            spaces = results.get(src)
+            if spaces is None:
+                spaces = self.los_cache.get(src, {})
+            merge_visibility(visible, spaces.items())
+        self.visible_spaces = visible
         super().step_complete()
 
     def new_phase(self, phase):
@@ -103,18 +161,29 @@ class SalvageGame(Game):
                 self.phase.all_ready(self)
             e.rm_watcher(self.readiness_watch)
 
-    def add_visible_spaces(self, spaces):
-        d = self.visible_spaces
-        for (k, v) in spaces:
-            d[k] = max(v, d.get(k, 0))
+    def draw_to_board(self, out_board):
+        # Visibility is shared by everyone, so this can all go in the snapshot
+        for k in self.visible_spaces:
+            tile = self.board.require_tile(k)
+            visibility = self.visible_spaces[k];
+            for ent in tile.contents:
+                # TODO some ents may not be drawn depending on `visibility`
+                # TODO again: Maybe `Entity.draw` should just accept a tile,
+                #   and we handle fetching it if there are a positive number of ents?
+                ent.draw(out_board)
+            if visibility == 1:
+                out_board.require_tile(k).add("hex_overlay_white")
+            elif visibility == 2:
+                out_board.require_tile(k).add("hex_overlay_light_white")
+        for c in self.characters:
+            for e in c.eyeballs:
+                for p, d in e.path:
+                    out_board.require_tile(p).add(f"hex_arrow_{d}")
+        for e in self.reqd_units.difference(self.ready_units):
+            out_board.require_tile(e.pos).add("hex_select_2")
+
     def is_opaque(self, pos):
-        stuff = self.board.get_tile(pos).contents
-        if len(stuff) == 0:
-            return True
-        for e in stuff:
-            if isinstance(e, SpriteEnt) and e.sprite == "hex_wall":
-                return True
-        return False
+        return not self.clear.get(pos)
     def is_walkable(self, pos):
         # Eventually this will also have to return false for
         # enemy units etc. We could friendly units as walkable
@@ -200,24 +269,6 @@ class SalvageCharacter(Character):
         self.selected = None
         super().__init__(*a, layout = layout, **kwa)
     def draw_to_board(self, out_board):
-        for k in self.game.visible_spaces:
-            tile = self.game.board.require_tile(k)
-            visibility = self.game.visible_spaces[k];
-            for ent in tile.contents:
-                # TODO some ents may not be drawn depending on `visibility`
-                # TODO again: Maybe `Entity.draw` should just accept a tile,
-                #   and we handle fetching it if there are a positive number of ents?
-                ent.draw(out_board)
-            if visibility == 1:
-                out_board.require_tile(k).add("hex_overlay_white")
-            elif visibility == 2:
-                out_board.require_tile(k).add("hex_overlay_light_white")
-        for c in self.game.characters:
-            for e in c.eyeballs:
-                for p, d in e.path:
-                    out_board.require_tile(p).add(f"hex_arrow_{d}")
-        for e in self.game.reqd_units.difference(self.game.ready_units):
-            out_board.require_tile(e.pos).add("hex_select_2")
         status_line = '{Complete|/done}'
         s = self.selected
         if s is not None:
@@ -251,9 +302,6 @@ class SalvageCharacter(Character):
         else:
             self.selected = None
             e.rm_watcher(self.select_watch)
-    def do_los(self):
-        for e in self.eyeballs:
-            self.game.add_visible_spaces(los_fill(self.game.is_opaque, e.pos))
     def set_player(self, p):
         if p is None:
             if self.player is not None:
@@ -286,13 +334,13 @@ class SalvageCharacter(Character):
                     self.mode = MODE_DEFAULT
                     self.step_complete()
                     return
-                if isinstance(e, SpriteEnt) and e.sprite == "hex_wall":
+                if isinstance(e, Terrain) and e.opaque:
                     e._move(None)
                     self.mode = MODE_DEFAULT
                     self.game.step_complete()
                     return
             if self.mode == MODE_DEFAULT:
-                new_ent = SpriteEnt("hex_wall", self.game)
+                new_ent = Terrain("hex_wall", True, self.game)
             else:
                 new_ent = Eyeball(self.game)
                 new_ent.add_watcher(self.eye_watch)
@@ -323,7 +371,8 @@ class SalvageCharacter(Character):
         s.vote = ballot if ballot != s.vote else None
         if s.vote_options != None:
             self.game.update_unit_readiness(s, s.vote is not None)
-        self.step_complete()
+        # Readiness is drawn in the shared snapshot, so everyone needs an update
+        self.game.step_complete()
     def rm_selected(self):
         if self.selected is None:
             raise PebkacException("Nothing selected, cannot remove!")
@@ -333,6 +382,20 @@ class SalvageCharacter(Character):
         self.mode = MODE_EYE if self.mode == MODE_DEFAULT else MODE_DEFAULT
         self.step_complete()
 
+class Terrain(SpriteEnt):
+    "Grass, walls, etc. These decide what can be seen through and walked on."
+    __slots__ = ('opaque',)
+    def __init__(self, sprite, opaque, *a, **ka):
+        self.opaque = opaque
+        super().__init__(sprite, *a, **ka)
+    def _move(self, pos):
+        old = self.pos
+        super()._move(pos)
+        if old is not None:
+            self.game.terrain_changed(old)
+        if pos is not None:
+            self.game.terrain_changed(pos)
+
 class Eyeball(WatchedEnt, SpriteEnt):
     def __init__(self, *a, **ka):
         self.move_reqd = False
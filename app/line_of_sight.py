@@ -1,9 +1,11 @@
 from . import vector as vec
 from heapq import heappush, heappop
+from bisect import bisect_right
+from math import atan2, pi, sqrt, tau
 
 # All these calculations are done in hex grid coordinate space,
 # which is slightly skewed and stretched from actual "display" space.
-# (The one exception is we priority queue our spaces based on the display distance,
+# (The one exception is we order our spaces based on the display distance,
 #  because I can't picture the grid coord space clearly enough to be sure it works there too)
 # This works because affine transformations preserve straight lines,
 # so if you can see it in one space you can see it in the other.
@@ -38,13 +40,9 @@ def get_visual_extent(v):
         raise Exception("visual extent of a cell should always be less that half a circle!")
     return (leftmost, rightmost)
 
-# Visual arc, a range not obscured by shadow
-class Arc:
-    def __init__(self, heap, marked):
-        self.heap = heap
-        self.marked = marked
-
-class WholeArc(Arc):
+# Visual arc, a range not obscured by shadow.
+# `shadow` returns whatever is left of the arc (which may be itself), in order.
+class WholeArc:
     def intersects(self, pair):
         return True
     def __repr__(self):
@@ -52,11 +50,10 @@ class WholeArc(Arc):
     def contains(self, v):
         return True
     def shadow(self, pair):
-        return [ConcaveArc(pair[1], pair[0], self.heap, self.marked)]
+        return [ConcaveArc(pair[1], pair[0])]
 
-class ConcaveArc(Arc):
-    def __init__(self, left, right, *a, **ka):
-        super().__init__(*a, **ka)
+class ConcaveArc:
+    def __init__(self, left, right):
         self.left = left
         self.right = right
     def __repr__(self):
@@ -71,23 +68,19 @@ class ConcaveArc(Arc):
         return vec.cross(self.left, v) >= 0 or vec.cross(v, self.right) >= 0
     def shadow(self, pair):
         if vec.cross(pair[1], self.right) > 0:
-            # Pass ownership of our heap/marked to this Arc, it may be the only one
-            right_arc = ConvexArc(pair[1], self.right, self.heap, self.marked)
+            right_arc = ConvexArc(pair[1], self.right)
             if vec.cross(pair[0], self.left) >= 0:
                 if vec.cross(self.right, pair[0]) >= 0:
                     return [right_arc]
                 else:
                     self.right = pair[0]
-                    self.heap = self.heap.copy()
-                    self.marked = self.marked.copy()
                     return [self, right_arc]
             else:
-                left_arc = ConvexArc(self.left, pair[0], self.heap.copy(), self.marked.copy())
-                return [left_arc, right_arc]
+                return [ConvexArc(self.left, pair[0]), right_arc]
         else:
             if vec.cross(pair[1], self.left) >= 0:
                 if vec.cross(self.left, pair[0]) > 0:
-                    return [ConvexArc(self.left, pair[0], self.heap, self.marked)]
+                    return [ConvexArc(self.left, pair[0])]
                 else:
                     self.right = pair[0]
                     return [self]
@@ -96,13 +89,12 @@ class ConcaveArc(Arc):
                     self.left = pair[1]
                     return [self]
                 else:
-                    left_arc = ConvexArc(self.left, pair[0], self.heap.copy(), self.marked.copy())
+                    left_arc = ConvexArc(self.left, pair[0])
                     self.left = pair[1]
                     return [left_arc, self]
 
-class ConvexArc(Arc):
-    def __init__(self, left, right, *a, **ka):
-        super().__init__(*a, **ka)
+class ConvexArc:
+    def __init__(self, left, right):
         self.left = left
         self.right = right
     def __repr__(self):
@@ -126,61 +118,212 @@ class ConvexArc(Arc):
                 self.right = pair[0]
                 return [self]
             else:
-                other = ConvexArc(pair[1], self.right, self.heap.copy(), self.marked.copy())
+                other = ConvexArc(pair[1], self.right)
                 self.right = pair[0]
                 return [self, other]
 
-def los_fill(occlude_func, src):
+# Arcs are kept sorted by where they start (going counterclockwise), along with rough
+# floating-point bounds so we can quickly find the few that might overlap a cell.
+# Whether they actually do is still decided with the exact integer math above.
+SLOP = 1e-9
+# Below this many arcs it's quicker to just check them all
+FEW_ARCS = 4
+
+def angle(v):
+    return atan2(v[1], v[0])
+
+def span(a, b):
+    "Floating-point angles going counterclockwise from `a` to `b`, with the start in (-pi, pi]"
+    start = angle(a)
+    end = angle(b)
+    if end <= start:
+        end += tau
+    return (start, end)
+
+def arc_span(arc):
+    if isinstance(arc, WholeArc):
+        return (-pi, pi)
+    return span(arc.left, arc.right)
+
+# Every offset from the viewer, with everything about it that doesn't depend on the board,
+# sorted nearest first (by display distance, same as `los_fill` uses).
+# Entries are (distance, offset, visual extent, its floating-point span, extent of a 1/3 scale hex in the center, neighbors).
+# `los_fill` puts these straight on its frontier.
+# It's shared by everyone and only ever grows, a few rings at a time.
+# The whole tuple gets replaced at once, so anybody still holding the old list of entries can keep using it.
+offset_table = ([], -1, 0) # (entries, rings included, how many entries are in their final place)
+# Entry for each offset in `offset_table`
+offset_entries = {}
+# Display distance between rings (by `vec.measure`), at the closest
+RING_SPACING = sqrt(3) / 2
+
+def make_offset_entry(distance, offset):
+    around = tuple(vec.add(offset, u) for u in vec.units)
+    if offset == (0, 0):
+        # Can't see our own cell "from" anywhere
+        return (distance, offset, None, None, None, None, around)
+    pair = get_visual_extent(offset)
+    (lo, hi) = span(pair[0], pair[1])
+    return (distance, offset, pair, lo, hi, get_visual_extent(vec.mult(offset, 3)), around)
+
+def get_offset_table(needed):
+    "Returns (entries, final) from `offset_table`, with more than `needed` entries final"
+    global offset_table
+    (entries, rings, final) = offset_table
+    while final <= needed:
+        new_rings = max(rings * 2, 8)
+        offsets = []
+        for r in range(rings + 1, new_rings + 1):
+            offsets += vec.ring((0, 0), r)
+        added = [make_offset_entry(d, o) for d, o in zip(vec.display_dist_many(offsets), offsets)]
+        entries = entries[:final] + sorted(entries[final:] + added)
+        rings = new_rings
+        # Nothing in the rings we haven't added yet could come before this
+        limit = rings * RING_SPACING
+        while final < len(entries) and entries[final][0] < limit:
+            final += 1
+        for e in added:
+            offset_entries[e[1]] = e
+        offset_table = (entries, rings, final)
+    return (entries, final)
+
+def lookup_offset(offset):
+    "The `offset_table` entry for `offset`, growing the table if needed"
+    while offset not in offset_entries:
+        get_offset_table(len(offset_table[0]))
+    return offset_entries[offset]
+
+def overlapping(arcs, starts, ends, pair, lo, hi):
+    if len(arcs) <= FEW_ARCS:
+        return [arc for arc in arcs if arc.intersects(pair)]
+    found = []
+    # Arcs (and cells) can wrap around past pi, so we might need to check one lap either side as well
+    for shift in (0, tau, -tau):
+        if shift > 0 and ends[-1] <= lo + shift - SLOP:
+            continue
+        if shift < 0 and hi + shift + SLOP < starts[0]:
+            continue
+        i = bisect_right(starts, hi + shift + SLOP) - 1
+        while i >= 0 and ends[i] > lo + shift - SLOP:
+            arc = arcs[i]
+            if arc not in found and arc.intersects(pair):
+                found.append(arc)
+            i -= 1
+    return found
+
+def los_fill(occlude_func, src, max_radius=None, bounds=None):
+    """
+    Returns a list of (position, visibility) for everything that can be seen from `src`,
+    including the opaque cells that block the view.
+    Without limits, this keeps going until everything is in shadow, which depends entirely on `occlude_func`.
+    If given, nothing past `max_radius` (in display distance) is looked at, as though it weren't there at all.
+    Everything outside `bounds` ((min_x, min_y, max_x, max_y), like `Board` keeps) is opaque.
+    """
+    # Cells come off a single frontier, nearest first, and get clipped against
+    # all the arcs that are still visible. Arcs only ever shrink or split,
+    # so a cell that misses all of them is in shadow for good (and so is everything behind it).
+    # The frontier holds entries from `offset_table`, so nothing about a cell's geometry is worked out here.
     ret = []
     ret.append((src, 3))
-    start_heap = []
-    for u in vec.units:
-        heappush(start_heap, (1, u))
-    start_marked = set(vec.units)
-    start_marked.add((0, 0))
-    arcs = [WholeArc(start_heap, start_marked)]
-    while len(arcs) > 0:
-        arc = arcs[0]
-        while True:
-            (distance, offset) = heappop(arc.heap)
-            #if distance < 1.5:
-            #    print('Pulled ' + str(offset))
-
-            pair = get_visual_extent(offset)
-            if not arc.intersects(pair):
+    heap = []
+    marked = set()
+    marked.add((0, 0))
+    def expand(around):
+        for neighbor in around:
+            if neighbor in marked:
                 continue
-            position = vec.add(src, offset)
-            if occlude_func(position):
-                ret.append((position, 3))
-                arcs = arc.shadow(pair) + arcs[1:]
-                #if distance < 1.5:
-                #    print('arcs is now ' + repr(arcs))
-                break
+            marked.add(neighbor)
+            e = offset_entries.get(neighbor)
+            if e is None:
+                # Off the end of the table so far
+                e = lookup_offset(neighbor)
+            if max_radius is not None and e[0] > max_radius:
+                continue
+            heappush(heap, e)
+    expand(lookup_offset((0, 0))[6])
+    arcs = [WholeArc()]
+    starts = [-pi]
+    ends = [pi]
+    while len(arcs) > 0 and len(heap) > 0:
+        (distance, offset, pair, lo, hi, inner_pair, around) = heappop(heap)
 
-            """
-            # Will include the position w/ `True` if the center is visible,
-            # or `False` if part of the cell (but not the center) is visible.
-            if not arc.contains(offset):
-                visibility = 1
-            elif arc.contains(pair[0]) and arc.contains(pair[1]):
-                visibility = 3
-            else:
-                visibility = 2
-            """
-            # Experimenting with: hex is fully colored if you can fully see a 1/3 scale hex in the center,
-            # and is dim otherwise
-            inner_pair = get_visual_extent(vec.mult(offset, 3))
+        hit = overlapping(arcs, starts, ends, pair, lo, hi)
+        if not hit:
+            continue
+        position = vec.add(src, offset)
+        if bounds is not None:
+            (x, y) = position
+            # Off the edge is opaque, no need to ask
+            outside = x < bounds[0] or y < bounds[1] or x >= bounds[2] or y >= bounds[3]
+        else:
+            outside = False
+        if outside or occlude_func(position):
+            ret.append((position, 3))
+            remaining = []
+            for arc in arcs:
+                if arc in hit:
+                    remaining += arc.shadow(pair)
+                else:
+                    remaining.append(arc)
+            spans = sorted((arc_span(arc), j) for j, arc in enumerate(remaining))
+            arcs = [remaining[j] for _, j in spans]
+            starts = [start for (start, _), _ in spans]
+            ends = [end for (_, end), _ in spans]
+            continue
+
+        """
+        # Will include the position w/ `True` if the center is visible,
+        # or `False` if part of the cell (but not the center) is visible.
+        if not arc.contains(offset):
+            visibility = 1
+        elif arc.contains(pair[0]) and arc.contains(pair[1]):
+            visibility = 3
+        else:
+            visibility = 2
+        """
+        # Experimenting with: hex is fully colored if you can fully see a 1/3 scale hex in the center,
+        # and is dim otherwise
+        visibility = 1
+        for arc in hit:
             # For our situation, containing both ends is equivalent to encompassing the entire arc
             if arc.contains(inner_pair[0]) and arc.contains(inner_pair[1]):
                 visibility = 3
-            else:
-                visibility = 1
+                break
 
-            ret.append((position, visibility))
+        ret.append((position, visibility))
+        expand(around)
+    return ret
 
-            for u in vec.units:
-                neighbor = vec.add(offset, u)
-                if neighbor not in arc.marked:
-                    arc.marked.add(neighbor)
-                    heappush(arc.heap, (vec.display_dist(neighbor), neighbor))
+def los_fill_many(occlude_func, sources, max_radius=None, bounds=None):
+    """
+    `los_fill` from each of `sources`, sharing one look at the board:
+    `occlude_func` is only called once per position, however many sources can see it.
+    Returns a dict of each source to a dict of positions to visibility.
+    """
+    opaque = {}
+    def occlude_once(position):
+        ret = opaque.get(position)
+        if ret is None:
+            ret = opaque[position] = occlude_func(position)
+        return ret
+    ret = {}
+    for src in sources:
+        if src in ret:
+            continue
+        visible = {}
+        merge_visibility(visible, los_fill(occlude_once, src, max_radius, bounds))
+        ret[src] = visible
     return ret
+
+def merge_visibility(visible, items):
+    "Adds (position, visibility) `items` into the dict `visible`, keeping the best visibility for each position"
+    for (k, v) in items:
+        if v > visible.get(k, 0):
+            visible[k] = v
+
+def visible_from(occlude_func, sources, max_radius=None, bounds=None):
+    "Like `los_fill_many`, but everything visible from any of `sources` together in one dict"
+    visible = {}
+    for spaces in los_fill_many(occlude_func, sources, max_radius, bounds).values():
+        merge_visibility(visible, spaces.items())
+    return visible
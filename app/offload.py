@@ -0,0 +1,69 @@
+import asyncio
+import traceback
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+
+# Where heavy, pure computations get run (see `Offloader`).
+# `None` means right away, on the event loop, like everything else.
+executor = None
+
+def configure(mode, workers = None):
+    "`mode` is one of 'none', 'thread', or 'process'"
+    global executor
+    if mode == 'thread':
+        executor = ThreadPoolExecutor(workers)
+    elif mode == 'process':
+        executor = ProcessPoolExecutor(workers)
+    else:
+        executor = None
+
+class Offloader:
+    """
+    Runs `compute(*args)` on the executor, then `apply(result)` back on the event loop.
+    Only one computation is in flight at a time; anything submitted meanwhile
+    replaces whatever was already waiting, so results are applied in the order
+    they were submitted and stale ones are skipped entirely.
+    `compute` and `args` have to be picklable if the executor is a process pool,
+    and `args` shouldn't be anything the game is going to keep modifying.
+    """
+    def __init__(self):
+        self.task = None
+        self.waiting = None
+    def submit(self, compute, args, apply):
+        if executor is None:
+            apply(compute(*args))
+            return
+        if self.task is not None:
+            self.waiting = (compute, args, apply)
+            return
+        self.task = asyncio.create_task(self.loop(compute, args, apply))
+    def skip(self, result, apply):
+        "Like `submit`, for when the result is already known. It still waits its turn though."
+        if self.task is None:
+            apply(result)
+        else:
+            self.waiting = (None, (result,), apply)
+    async def loop(self, compute, args, apply):
+        try:
+            while True:
+                if compute is None:
+                    # From `skip`, nothing to compute
+                    apply(*args)
+                else:
+                    try:
+                        result = await asyncio.get_running_loop().run_in_executor(executor, compute, *args)
+                    except Exception:
+                        # Whatever went wrong, the game is still waiting on an answer
+                        print("Exception in offloaded computation, running it here instead:")
+                        traceback.print_exc()
+                        result = compute(*args)
+                    apply(result)
+                if self.waiting is None:
+                    break
+                (compute, args, apply) = self.waiting
+                self.waiting = None
+        finally:
+            self.task = None
+    def cancel(self):
+        self.waiting = None
+        if self.task is not None:
+            self.task.cancel()
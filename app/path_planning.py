@@ -1,45 +1,54 @@
 from . import vector as vec
+from heapq import heappush, heappop
+from itertools import count
 
 def update_path(start, l, max_len, dest, traversable_fn):
-    # This ordering is better for when we care about the destination, and less about the path.
-    ps = [(start, 0)] + [(l[i][0], i+1) for i in range(len(l))]
-    # If we care about the path more, we would add something like this:
-    #ps.reverse()
-    #if len(l) and ps[0][0] == dest:
-    #    ps = ps[1:]
+    """
+    Plans a path (list of (position, direction)) from `start` to `dest`, at most `max_len` steps long.
+    `l` is the current path; if there's no way to `dest` it's returned unchanged.
+    The new path is as short as possible, and out of those keeps as much of the start of `l` as it can.
+    """
+    # A* search, starting from every point along `l` at once, since we can keep the steps that got there.
+    # Nodes are ranked by (estimated total length, -steps of `l` kept, distance to go),
+    # which favors reusing `l` and then heading straight for the destination.
+    seq = count()
+    heap = []
+    best = {} # Position -> (steps so far, -steps of `l` kept)
+    came_from = {} # Position -> (previous position, direction), or (None, steps of `l` kept)
+    def push(pos, steps, kept, prev):
+        to_go = vec.measure(vec.sub(dest, pos))
+        if steps + to_go > max_len:
+            return
+        key = (steps, -kept)
+        if pos in best and best[pos] <= key:
+            return
+        best[pos] = key
+        came_from[pos] = prev
+        heappush(heap, (steps + to_go, -kept, to_go, next(seq), pos))
 
-    # Try to get to the dest greedily from each of our possible starting points
-    for pos, i in ps:
-        remaining = max_len - i
-        # This is just an efficiency boost when searching forwards,
-        # and if searching backwards it allows us to enforce finding
-        # a new path under some conditions.
-        do_check = i < len(l)
-        steps = []
-        # Loop adding more steps until we get there or fail
-        while True:
-            if pos == dest:
-                return l[:i] + steps
-            offset = vec.sub(dest, pos)
-            if vec.measure(offset) > remaining:
-                # Won't be able to complete our path in time,
-                # abandon this starting point
-                break
-            for option in vec.calc_angles(offset, 1):
-                next = vec.add(pos, vec.units[option])
-                if traversable_fn(next):
-                    remaining -= 1
-                    pos = next
-                    steps.append((pos, option))
-                    break
-            else:
-                # No suitable options found to advance,
-                # abandon this starting point
-                break
-            if do_check:
-                do_check = False
-                if l[i][0] == pos:
-                    # In this case we just re-planned the same next step,
-                    # which we can throw out as irrelevant calculation.
-                    break
+    push(start, 0, 0, (None, 0))
+    for i in range(len(l)):
+        push(l[i][0], i+1, i+1, (None, i+1))
+
+    while len(heap) > 0:
+        (estimate, neg_kept, to_go, _, pos) = heappop(heap)
+        steps = estimate - to_go
+        if best[pos] != (steps, neg_kept):
+            # Found a better way here since this was queued
+            continue
+        if pos == dest:
+            path = []
+            while True:
+                (prev, d) = came_from[pos]
+                if prev is None:
+                    return l[:d] + path[::-1]
+                path.append((pos, d))
+                pos = prev
+        # Try the directions that head most directly to the destination first,
+        # so they win ties and paths look like the straight lines people expect.
+        preferred = vec.calc_angles(vec.sub(dest, pos), 1)
+        for d in preferred + [d for d in range(6) if d not in preferred]:
+            next_pos = vec.add(pos, vec.units[d])
+            if traversable_fn(next_pos):
+                push(next_pos, steps + 1, -neg_kept, (pos, d))
     return l
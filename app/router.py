@@ -0,0 +1,52 @@
+import asyncio
+import traceback
+import zlib
+
+# The front end for running lobbies across several worker processes.
+# Each worker is an ordinary websocket server listening on localhost;
+# we just peek at the path in the client's upgrade request (which is what picks the lobby)
+# and then shovel bytes back and forth between the client and whichever worker owns that path.
+# This way everyone in a lobby always ends up in the same process.
+
+def pick_worker(path, ports):
+    # `hash()` is salted per process, so use something stable
+    return ports[zlib.crc32(path.encode()) % len(ports)]
+
+async def pipe(reader, writer):
+    try:
+        while True:
+            data = await reader.read(65536)
+            if not data:
+                break
+            writer.write(data)
+            await writer.drain()
+    finally:
+        writer.close()
+
+async def route(ports, client_reader, client_writer):
+    try:
+        try:
+            head = await client_reader.readuntil(b'\r\n\r\n')
+        except (asyncio.IncompleteReadError, asyncio.LimitOverrunError):
+            client_writer.close()
+            return
+        # e.g. "GET /some/lobby HTTP/1.1"
+        request_line = head.split(b'\r\n', 1)[0].decode('latin-1').split(' ')
+        if len(request_line) != 3:
+            client_writer.close()
+            return
+        port = pick_worker(request_line[1], ports)
+        worker_reader, worker_writer = await asyncio.open_connection('127.0.0.1', port)
+        worker_writer.write(head)
+        await asyncio.gather(
+            pipe(client_reader, worker_writer),
+            pipe(worker_reader, client_writer),
+            return_exceptions = True
+        )
+    except Exception:
+        print("Exception routing connection:")
+        traceback.print_exc()
+        client_writer.close()
+
+def serve(port, ports):
+    return asyncio.start_server(lambda r, w: route(ports, r, w), port = port)
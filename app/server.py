@@ -1,38 +1,74 @@
+import argparse
 import asyncio
 import json
 import logging
+import multiprocessing
+import sys
+import struct
+from time import monotonic
 import websockets
+from websockets.extensions.permessage_deflate import ServerPerMessageDeflateFactory
 import traceback
 #import png
 #import random
 #import math 
 #import os
 
-from . import game
+from . import game, tasks, router, offload
 from .board import *
 from .common import *
 from .games import GrowGame, PathGame, SalvageGame
 
 logging.basicConfig()
 
-async def send_outgoing(queue, socket):
+async def send_outgoing(player, socket):
+    queue = player.outgoing_queue
     while True:
-        await socket.send(await queue.get())
+        (msg, is_arena) = await queue.get()
+        # This is where a slow client holds us up, once the socket's write buffer fills
+        await socket.send(msg)
         queue.task_done()
+        if is_arena:
+            player.arena_sent()
+
+# Default cap on how often a player gets sent the arena, regardless of how fast the game is going
+MAX_FPS = 30
+# If a client falls this far behind, it's probably not coming back, so we drop it
+# rather than let its backlog grow forever
+MAX_QUEUED = 500
+
+# Binary arena updates, for clients that asked for them when they sent `/name`:
+#   header: kind (u8, always BIN_ARENA), update count (u32)
+#   each update: x (i32), y (i32), ver (i8), keep (u16), add count (u16), then that many sprite ids (u16)
+# All little-endian. Sprite ids index into the lobby's list of sprite names,
+# which is sent along (as JSON "sprites" messages) whenever it grows.
+BIN_ARENA = 1
+bin_header = struct.Struct('<BI')
+bin_update = struct.Struct('<iibHH')
 
 def mk_msg_dict(msg):
     return {"type":"text", "msg":msg}
 
 class VersionedTile(Tile):
+    __slots__ = ('version',)
     def __init__(self):
         self.version = -1
         super().__init__()
 
 class Player:
-    def __init__(self, lobby, socket, name):
+    def __init__(self, lobby, socket, name, binary = False):
         self.lobby = lobby
+        self.socket = socket
+        self.binary = binary
+        # How many of the lobby's sprite names our client knows about
+        self.sprites_sent = 0
+        # Entries are (json string, whether it's an arena update)
         self.outgoing_queue = asyncio.Queue()
-        self.outgoing_task = asyncio.create_task(send_outgoing(self.outgoing_queue, socket))
+        self.overflowed = False
+        # Only one arena update waits in the queue at a time, see `do_frame`
+        self.arena_queued = False
+        self.frame_wanted = False
+        self.outgoing_task = asyncio.create_task(send_outgoing(self, socket))
         if not name:
             i=1
             while True:
@@ -52,8 +88,16 @@ class Player:
         lobby.players.append(self)
         self.lobby.broadcast(f">>> {self.name} joined")
         self.status = ""
-        self.client_board = Board(tile_offset = None, tile_type = VersionedTile)
+        self.client_board = ChunkedBoard(tile_type = VersionedTile)
         self.board_layout = None
+        # Which snapshot `client_board` was last synced with,
+        # and where we drew extras on top of it
+        self.snapshot_gen = None
+        self.overlay_positions = set()
+        self.frame_interval = 1 / MAX_FPS if MAX_FPS else 0
+        self.last_frame = -self.frame_interval
+        # Set while we're holding off on a frame, see `request_frame`
+        self.frame_handle = None
         self.character = None
         if self.lobby.game is not None:
             self.lobby.game.seat_player(self)
@@ -61,8 +105,55 @@ class Player:
         self.character = char
         if char != None:
             self.do_frame()
-    def send_dict(self, d):
-        self.outgoing_queue.put_nowait(json.dumps(d))
+    def set_fps(self, arg):
+        try:
+            fps = float(arg)
+        except ValueError:
+            raise PebkacException("Frame rate must be a number")
+        if fps < 0:
+            raise PebkacException("Frame rate can't be negative")
+        self.frame_interval = 1 / fps if fps else 0
+        self.whisper_raw(f"... Frame rate capped at {fps:g} per second" if fps else "... Frame rate uncapped")
+    def request_frame(self):
+        """
+        Does a frame now, unless we did one too recently,
+        in which case the latest state goes out as soon as we're allowed.
+        """
+        if self.frame_handle is not None:
+            return
+        wait = self.last_frame + self.frame_interval - monotonic()
+        if wait <= 0:
+            self.do_frame()
+        else:
+            self.frame_handle = asyncio.get_running_loop().call_later(wait, self.flush_frame)
+    def flush_frame(self):
+        self.frame_handle = None
+        if self.character is not None:
+            self.do_frame()
+    def cancel_frame(self):
+        if self.frame_handle is not None:
+            self.frame_handle.cancel()
+            self.frame_handle = None
+    def send_dict(self, d, is_arena = False):
+        self.send_raw(json.dumps(d), is_arena)
+    def send_raw(self, msg, is_arena = False):
+        "Sends an already-encoded message"
+        if self.overflowed:
+            return
+        if self.outgoing_queue.qsize() >= MAX_QUEUED:
+            self.overflowed = True
+            print(f"{self.name} has {MAX_QUEUED} messages backed up, disconnecting")
+            asyncio.create_task(self.socket.close())
+            return
+        self.outgoing_queue.put_nowait((msg, is_arena))
+    def queue_depth(self):
+        return self.outgoing_queue.qsize()
+    def arena_sent(self):
+        self.arena_queued = False
+        if self.frame_wanted:
+            self.frame_wanted = False
+            if self.character is not None:
+                self.request_frame()
     def set_status(self, text):
         if text != self.status:
             self.status = text
@@ -75,66 +166,142 @@ class Player:
         self.lobby.broadcast(f">>> {self.name} renamed to {name}")
         self.name = name
     def do_frame(self):
-        old_board = self.client_board
-        if old_board.min_x == None:
-            new_board = Board(tile_offset = None, tile_type = VersionedTile)
-        else:
-            new_board = Board(
-                (old_board.min_x - 1, old_board.min_y - 1), 
-                old_board.max_x - old_board.min_x + 2,
-                old_board.max_y - old_board.min_y + 2,
-                VersionedTile
-            )
+        self.cancel_frame()
+        if self.arena_queued:
+            # The client hasn't even been sent our last update yet,
+            # so no sense queueing up another behind it. Once that one's gone
+            # we'll do a frame, which covers everything that changed in the meantime.
+            self.frame_wanted = True
+            return
+        self.last_frame = monotonic()
+        game = self.character.game
+        snapshot = game.get_snapshot()
+        overlay = ChunkedBoard()
         send_me = {}
-        new_board_layout = self.character.draw_to_board(new_board)
+        new_board_layout = self.character.draw_to_board(overlay)
         if new_board_layout != self.board_layout:
             self.board_layout = new_board_layout
             send_me['layout'] = new_board_layout
             # Specifying the layout also clears the board client-side,
             # since usually it doesn't make sense to even use the same
             # sprites if the layout is changing
-            old_board = Board(tile_offset = None, tile_type = VersionedTile) # TODO This is used like 3x, make into a fn
-        old_bounds = ((old_board.min_x, old_board.min_y), (old_board.max_x, old_board.max_y))
-        new_bounds = ((new_board.min_x, new_board.min_y), (new_board.max_x, new_board.max_y))
-        if old_board.min_x is None:
-            if new_board.min_x is not None:
-                old_bounds = new_bounds
-        elif new_board.min_x is None:
-            new_bounds = old_bounds
+            self.client_board = ChunkedBoard(tile_type = VersionedTile)
+            self.snapshot_gen = None
+        overlay_positions = set(pos for pos, tile in overlay.items() if tile.contents)
+        # If the game remembers what changed since our last frame,
+        # that (and wherever our extras were) is all we need to look at
+        dirty = game.dirty_since(self.snapshot_gen)
+        if dirty is not None:
+            positions = dirty | self.overlay_positions | overlay_positions
+        else:
+            positions = self.all_positions(snapshot, overlay)
         updates = []
-        if old_bounds[0][0] is not None:
-            for x in range(min(old_bounds[0][0], new_bounds[0][0]), max(old_bounds[1][0], new_bounds[1][0])):
-                for y in range(min(old_bounds[0][1], new_bounds[0][1]), max(old_bounds[1][1], new_bounds[1][1])):
-                    old_tile = old_board.get_tile((x,y))
-                    new_tile = new_board.get_tile((x,y))
-                    l1 = len(old_tile.contents)
-                    l2 = len(new_tile.contents)
-                    if l2 > 0:
-                        new_tile.version = old_tile.version
-                    i = 0
-                    while i < l1 and i < l2:
-                        if old_tile.contents[i] != new_tile.contents[i]:
-                            break
-                        i += 1
-                    if l1 == l2 and i == l1:
-                        continue # Everything was the same
-                    updates.append({"x":x,"y":y,"ver":old_tile.version,"keep":i,"add":new_tile.contents[i:]})
-                    if l2 > 0:
-                        new_tile.version = int(not new_tile.version)
+        for pos in positions:
+            self.diff_tile(pos, snapshot, overlay, updates)
+        self.snapshot_gen = game.snapshot_gen
+        self.overlay_positions = overlay_positions
         if updates or send_me:
             send_me['type'] = 'arena'
             send_me['items'] = updates
-            self.send_dict(send_me)
-            self.client_board = new_board
+            self.arena_queued = True
+            # Layout changes are rare enough to not be worth a binary format
+            binary = self.binary and 'layout' not in send_me
+            msg = self.lobby.encode_frame(game.snapshot_gen, send_me, binary)
+            if binary:
+                self.send_sprite_names()
+            self.send_raw(msg, is_arena = True)
+    def send_sprite_names(self):
+        names = self.lobby.sprite_names
+        if self.sprites_sent < len(names):
+            self.send_dict({"type":"sprites","first":self.sprites_sent,"names":names[self.sprites_sent:]})
+            self.sprites_sent = len(names)
+    def all_positions(self, snapshot, overlay):
+        # Anything with contents has to have been allocated on one of these
+        positions = set()
+        for b in (self.client_board, snapshot, overlay):
+            positions.update(pos for pos, _ in b.items())
+        return positions
+    def diff_tile(self, pos, snapshot, overlay, updates):
+        old_tile = self.client_board.get_tile(pos)
+        old_contents = old_tile.contents
+        new_contents = snapshot.get_tile(pos).contents
+        extras = overlay.get_tile(pos).contents
+        if extras:
+            new_contents = [*new_contents, *extras]
+        elif old_contents is new_contents:
+            return
+        l1 = len(old_contents)
+        l2 = len(new_contents)
+        i = 0
+        while i < l1 and i < l2:
+            if old_contents[i] != new_contents[i]:
+                break
+            i += 1
+        if l1 == l2 and i == l1:
+            return # Everything was the same
+        (x, y) = pos
+        updates.append({"x":x,"y":y,"ver":old_tile.version,"keep":i,"add":new_contents[i:]})
+        # The snapshot's lists are never modified once drawn,
+        # so it's safe for the client board to share them
+        old_tile = self.client_board.require_tile(pos)
+        old_tile.contents = new_contents
+        if l2 > 0:
+            old_tile.version = int(not old_tile.version)
+        else:
+            old_tile.version = -1
 
 
+# How many different frames we remember the encoding of, per snapshot
+FRAME_CACHE_SIZE = 8
+
 class Lobby:
     def __init__(self):
         self.players = []
         self.game = None
+        # (snapshot gen, [(frame dict, whether it's binary, encoded frame)])
+        self.frame_cache = (None, [])
+        # For binary frames, which refer to sprites by index.
+        # `sprite_ids` maps names to their index, already packed.
+        self.sprite_names = []
+        self.sprite_ids = {}
     def broadcast_dict(self, d):
+        msg = json.dumps(d)
         for p in self.players:
-            p.send_dict(d)
+            p.send_raw(msg)
+    def encode_frame(self, gen, d, binary = False):
+        """
+        Players that are caught up to the same snapshot often end up with
+        the exact same frame, so we try to only encode each one once.
+        """
+        (cache_gen, cache) = self.frame_cache
+        if cache_gen != gen:
+            cache = []
+            self.frame_cache = (gen, cache)
+        for (other, other_binary, msg) in cache:
+            if other_binary == binary and other == d:
+                return msg
+        if binary:
+            msg = self.encode_binary_frame(d['items'])
+        else:
+            msg = json.dumps(d)
+        if len(cache) < FRAME_CACHE_SIZE:
+            cache.append((d, binary, msg))
+        return msg
+    def encode_binary_frame(self, updates):
+        ids = self.sprite_ids
+        parts = [bin_header.pack(BIN_ARENA, len(updates))]
+        for u in updates:
+            add = u["add"]
+            parts.append(bin_update.pack(u["x"], u["y"], u["ver"], u["keep"], len(add)))
+            for name in add:
+                try:
+                    parts.append(ids[name])
+                except KeyError:
+                    packed = struct.pack('<H', len(self.sprite_names))
+                    ids[name] = packed
+                    self.sprite_names.append(name)
+                    parts.append(packed)
+        return b''.join(parts)
     def broadcast(self, msg):
         self.broadcast_dict(mk_msg_dict(msg))
     def foo(self):
@@ -152,6 +319,27 @@ class Lobby:
         # This should never actually suspend, but for safety's sake we remove our avenues
         # of scheduling more tasks before we clean up the old game
         await game.cleanup()
+    def stats(self, player, args):
+        q = getattr(self.game, 'task_queue', None)
+        if args == 'on' or args == 'off':
+            if q is None:
+                raise PebkacException("No game with a task queue in progress!")
+            if args == 'on':
+                q.stats = tasks.QueueStats()
+                self.broadcast(f">>> {player.name} started collecting scheduler stats")
+            else:
+                q.stats = None
+                self.broadcast(f">>> {player.name} stopped collecting scheduler stats")
+        elif args == '':
+            player.whisper_raw('... Outgoing queues: ' + ', '.join(f"{p.name}:{p.queue_depth()}" for p in self.players))
+            if q is not None and q.stats is not None:
+                for line in q.stats.describe():
+                    player.whisper_raw('... ' + line)
+            elif q is not None:
+                player.whisper_raw("... (use '/stats on' to collect scheduler stats)")
+            player.whisper_raw('')
+        else:
+            raise PebkacException("Usage: /stats [on|off]")
     def start_game(self, player, args):
         if self.game != None:
             raise PebkacException("Game already in progress!")
@@ -175,6 +363,8 @@ def print_help(player):
     player.whisper_raw('... /game [game] - start a game (run w/ no name to get a list)')
     player.whisper_raw('... /lobby       - stop the game')
     player.whisper_raw('... /name [name] - set your name')
+    player.whisper_raw('... /fps [n]     - cap how often the board is sent to you (0 for no cap)')
+    player.whisper_raw('... /stats [on|off] - show (or start/stop collecting) scheduler stats')
     player.whisper_raw('')
 
 async def connection_handler(websocket, path):
@@ -183,10 +373,12 @@ async def connection_handler(websocket, path):
         print(f"First message was not '/name ...', closing socket. Got '{message}'")
         await websocket.close()
         return
+    # Clients can list what they support on lines after their name
+    (name, *options) = message[6:].split('\n')
     if path not in lobby_dict:
         lobby_dict[path] = Lobby()
     lobby = lobby_dict[path]
-    player = Player(lobby, websocket, message[6:])
+    player = Player(lobby, websocket, name, binary = 'binary' in options)
     # Register player in lobby, make task for sending stuff out on the websocket
     try:
         # websocket.send(str)
@@ -205,6 +397,10 @@ async def connection_handler(websocket, path):
                         await lobby.exit_game(player)
                     elif (message + ' ').startswith('/game '):
                         lobby.start_game(player, (message+' ')[6:].strip())
+                    elif message.startswith('/fps '):
+                        player.set_fps(message[5:])
+                    elif (message + ' ').startswith('/stats '):
+                        lobby.stats(player, (message+' ')[7:].strip())
                     elif message == '/shelp':
                         print_help(player)
                     elif player.character != None:
@@ -228,14 +424,166 @@ async def connection_handler(websocket, path):
         lobby.players.remove(player)
         lobby.broadcast(f">>> {player.name} has left")
 
+        player.cancel_frame()
         player.outgoing_task.cancel()
         await asyncio.gather(player.outgoing_task, return_exceptions=True)
         await websocket.close()
 
-# TODO Port is a program arg
+def at_least(kind, low):
+    "An argparse `type` for numbers that can't be below `low`"
+    def convert(text):
+        ret = kind(text)
+        if ret < low:
+            raise argparse.ArgumentTypeError(f"must be at least {low}: {text}")
+        return ret
+    convert.__name__ = kind.__name__
+    return convert
+
+def config_argv(parser, path):
+    """
+    Turns a JSON config file into command-line args, so it gets exactly the same checks.
+    `null` leaves an option at its default, and `true`/`false` are for switches.
+    """
+    with open(path) as f:
+        config = json.load(f)
+    actions = {action.dest: action for action in parser._actions}
+    ret = []
+    for (k, v) in config.items():
+        action = actions.get(k.replace('-', '_'))
+        if action is None or action.dest in ('config', 'help'):
+            parser.error(f"Unknown option '{k}' in {path}")
+        if v is None:
+            continue
+        flag = action.option_strings[-1]
+        if action.nargs == 0:
+            if not isinstance(v, bool):
+                parser.error(f"'{k}' in {path} should be true or false")
+            if v:
+                ret.append(flag)
+        elif isinstance(v, (dict, list, bool)):
+            parser.error(f"Bad value for '{k}' in {path}: {json.dumps(v)}")
+        else:
+            ret += [flag, str(v)]
+    return ret
+
+def parse_args(argv = None):
+    parser = argparse.ArgumentParser(description = "Runs the game server (just the websockets, html/ needs a separate webserver)")
+    parser.add_argument('--config', metavar = 'FILE',
+        help = "JSON file of option names to values (e.g. {\"port\": 15001}); command-line args win over it")
+    parser.add_argument('--port', type = at_least(int, 0), default = 15000)
+    # Compression trades server CPU for bandwidth, which mostly matters for big arena frames
+    parser.add_argument('--compression', choices = ['deflate', 'none'], default = 'deflate',
+        help = "permessage-deflate, if the client supports it")
+    parser.add_argument('--deflate-level', type = int, choices = range(1, 10), metavar = 'LEVEL', default = None,
+        help = "zlib compression level, 1 (fast) to 9 (small)")
+    parser.add_argument('--deflate-window-bits', type = int, choices = range(8, 16), metavar = 'BITS', default = None,
+        help = "server_max_window_bits, 8 to 15; smaller uses less memory per connection")
+    parser.add_argument('--deflate-no-context-takeover', action = 'store_true',
+        help = "compress each message on its own, so no compression state is kept between messages")
+    parser.add_argument('--max-size', type = at_least(int, 0), default = 2**20,
+        help = "largest message accepted from a client, in bytes")
+    parser.add_argument('--max-queue', type = at_least(int, 0), default = 32,
+        help = "how many incoming messages to buffer per connection")
+    parser.add_argument('--write-limit', type = at_least(int, 0), default = 2**16,
+        help = "high-water mark of each connection's write buffer in bytes (the low-water mark is a quarter of this)")
+    parser.add_argument('--ping-interval', type = at_least(float, 0), default = 20)
+    parser.add_argument('--ping-timeout', type = at_least(float, 0), default = 20)
+    parser.add_argument('--workers', type = at_least(int, 0), default = 0,
+        help = "run lobbies across this many processes, with this one routing connections to them (0 to do it all here)")
+    parser.add_argument('--worker-base-port', type = at_least(int, 0), default = None,
+        help = "workers listen on localhost starting at this port (default is the one after --port)")
+    parser.add_argument('--offload', choices = ['none', 'thread', 'process'], default = 'none',
+        help = "where heavy computations (like Salvage's line of sight) run, so they don't hold up everything else")
+    parser.add_argument('--offload-workers', type = at_least(int, 1), default = None,
+        help = "size of the offload pool (default is up to the executor)")
+    parser.add_argument('--max-fps', type = at_least(float, 0), default = MAX_FPS,
+        help = "default cap on arena frames per second per player (0 for no cap)")
+    parser.add_argument('--max-queued', type = at_least(int, 0), default = MAX_QUEUED,
+        help = "outgoing messages a player can have backed up before they're disconnected")
+    if argv is None:
+        argv = sys.argv[1:]
+    args = parser.parse_args(argv)
+    if args.config is not None:
+        # The file goes first, so anything given on the command line overrides it
+        args = parser.parse_args(config_argv(parser, args.config) + argv)
+    if args.workers > 0 and args.offload == 'process':
+        # Workers are daemonic (so they go away with us), and those can't start processes of their own
+        parser.error("--offload process can't be used with --workers (try --offload thread)")
+    return args
+
+def serve_kwargs(args):
+    kwargs = {
+        'port': args.port,
+        'max_size': args.max_size,
+        'max_queue': args.max_queue,
+        'write_limit': args.write_limit,
+        'ping_interval': args.ping_interval,
+        'ping_timeout': args.ping_timeout,
+    }
+    if args.compression == 'none':
+        kwargs['compression'] = None
+    else:
+        compress_settings = None
+        if args.deflate_level is not None:
+            compress_settings = {'level': args.deflate_level}
+        kwargs['extensions'] = [ServerPerMessageDeflateFactory(
+            server_no_context_takeover = args.deflate_no_context_takeover,
+            server_max_window_bits = args.deflate_window_bits,
+            compress_settings = compress_settings,
+        )]
+    return kwargs
+
+def run_worker(args, port):
+    "A regular server, except only the router in the main process talks to it"
+    # With the spawn start method we don't inherit the globals `launch` set
+    global MAX_FPS, MAX_QUEUED
+    MAX_FPS = args.max_fps
+    MAX_QUEUED = args.max_queued
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    offload.configure(args.offload, args.offload_workers)
+    kwargs = serve_kwargs(args)
+    kwargs['host'] = '127.0.0.1'
+    kwargs['port'] = port
+    loop.run_until_complete(websockets.serve(connection_handler, **kwargs))
+    loop.run_forever()
+
+# Seconds between checks that the worker processes are still running
+WORKER_CHECK_INTERVAL = 1
+
+async def watch_workers(workers):
+    "Returns once any of the `workers` processes has exited"
+    while all(worker.is_alive() for worker in workers):
+        await asyncio.sleep(WORKER_CHECK_INTERVAL)
+
 # This code taken from the websockets tutorial, is there any less-ugly way to do this?
-def launch():
+def launch(argv = None):
+    global MAX_FPS, MAX_QUEUED
+    args = parse_args(argv)
+    MAX_FPS = args.max_fps
+    MAX_QUEUED = args.max_queued
+    if args.workers > 0:
+        # Start these before we have an event loop, so they don't inherit it
+        base = args.worker_base_port if args.worker_base_port is not None else args.port + 1
+        ports = [base + i for i in range(args.workers)]
+        workers = []
+        for port in ports:
+            worker = multiprocessing.Process(target = run_worker, args = (args, port), daemon = True)
+            worker.start()
+            workers.append(worker)
+        loop = asyncio.get_event_loop()
+        print(f"Init complete, routing connections to {len(ports)} workers")
+        loop.run_until_complete(router.serve(args.port, ports))
+        # The router can't tell when a worker is gone, so its lobbies would just stop connecting.
+        # Better to go down loudly and get restarted.
+        loop.run_until_complete(watch_workers(workers))
+        for worker in workers:
+            if not worker.is_alive():
+                print(f"Worker {worker.name} exited with code {worker.exitcode}, shutting down")
+            worker.terminate()
+        sys.exit(1)
+    offload.configure(args.offload, args.offload_workers)
     loop = asyncio.get_event_loop()
     print("Init complete, entering websocket loop")
-    loop.run_until_complete(websockets.serve(connection_handler, port=15000))
+    loop.run_until_complete(websockets.serve(connection_handler, **serve_kwargs(args)))
     loop.run_forever()
@@ -1,7 +1,10 @@
 import asyncio
 import traceback
-from time import monotonic
+from time import monotonic, perf_counter
 from math import inf
+from heapq import heappush, heappop
+from itertools import count
+from collections import deque
 
 from . import wait
 
@@ -11,84 +14,91 @@ ACT_PATIENCE=2
 SLOW_PATIENCE=3
 MAX_PATIENCE=4
 
-def bisect(l, p):
-    min = 0
-    max = len(l)
-    while min != max:
-        t = (min+max) // 2
-        if p(l[t]):
-            min = t+1
-        else:
-            max = t
-    return min
-
 class TaskQueue:
     def __init__(self):
+        # Heap of (time, seq, task). Times are absolute, so letting time pass
+        # is just bumping `self.now` instead of touching every task.
         self.pending=[]
-        self.immediates=[[]]
+        self.now = 0
+        # `seq` breaks ties between tasks at the same time, first-come first-served.
+        # Zero-delay tasks that can't run right away jump to the front of the line though
+        # (newest first), so they count down from there.
+        self.seq = count()
+        self.front_seq = count(-1, -1)
+        # One deque per patience level. Whichever batch is running lives in slot 0,
+        # so anything with zero patience gets tacked onto the end of it.
+        self.immediates=[deque()]
         self.running = 0
+        # Set this to a QueueStats to start collecting
+        self.stats = None
     def next_time(self):
         if len(self.pending):
-            return self.pending[0].time
+            return self.pending[0][0] - self.now
         return inf
     def wait_time(self, time):
         if time > self.next_time():
             raise Exception("Having a bad time")
-        for t in self.pending:
-            t.time -= time
+        self.now += time
     def schedule(self, func, delay, patience):
-        task = Task(func, delay, patience)
         if delay < 0:
             raise Exception("Delay cannot be negative!")
+        task = Task(func, self.now + delay, patience)
         if delay == 0:
             self._immediately(task)
         else:
-            ix = bisect(self.pending, lambda x: x.time <= delay)
-            self.pending.insert(ix, task)
+            self._push(task)
+    def _push(self, task):
+        heappush(self.pending, (task.time, next(self.seq), task))
     def _immediately(self, task):
         "add the task to the (patience)th immediate list."
         "If there aren't that many immediate lists yet, pad with empty lists."
         if task.patience < self.running:
             while len(self.immediates) <= task.patience:
-                self.immediates.append([])
+                self.immediates.append(deque())
             self.immediates[task.patience].append(task)
         else:
-            self.pending.insert(0, task)
+            heappush(self.pending, (task.time, next(self.front_seq), task))
     def run(self, patience = MAX_PATIENCE+1):
         if self.next_time() < 0:
             raise Exception("Negative time on a task!")
         self.running = patience
-        i = 0
+        pending = self.pending
         others = []
-        for t in self.pending:
-            if t.time == 0:
-                if t.patience < self.running:
-                    self._immediately(t)
-                else:
-                    others.append(t)
-                i += 1
+        while pending and pending[0][0] == self.now:
+            entry = heappop(pending)
+            if entry[2].patience < self.running:
+                self._immediately(entry[2])
             else:
-                break
-        others += self.pending[i:]
-        self.pending = others
+                others.append(entry)
+        # These keep their place in line, since they keep their `seq`
+        for entry in others:
+            heappush(pending, entry)
+        immediates = self.immediates
         while True:
-            for i in range(0, len(self.immediates)):
-                if self.immediates[i]:
-                    tmp = self.immediates[i]
-                    self.immediates[i] = []
-                    self.immediates[0] = tmp
+            for i in range(0, len(immediates)):
+                if immediates[i]:
+                    # Everything below `i` is empty, including slot 0,
+                    # so swapping just recycles that empty deque
+                    immediates[0], immediates[i] = immediates[i], immediates[0]
                     break
             else:
                 break # The dreaded python for/else construct
-            to_run = self.immediates[0]
+            to_run = immediates[0]
             while to_run:
-                t = to_run.pop(0)
+                t = to_run.popleft()
+                stats = self.stats
+                if stats is not None:
+                    start = perf_counter()
                 try:
                     t.func()
                 except Exception:
                     print("Exception running task:")
                     traceback.print_exc()
+                if stats is not None:
+                    stats.task_ran(t, perf_counter() - start)
         self.running = 0
+        if self.stats is not None:
+            self.stats.run_complete()
 
 class MillisTaskQueue(TaskQueue):
     "TaskQueue that manages its own running by tying the tasks' time to real-world milliseconds"
@@ -107,14 +117,26 @@ class MillisTaskQueue(TaskQueue):
                 if (next_time == inf):
                     return
 
-                self.zero_time = await wait.until(self.zero_time + next_time*self.sec_per_turn)
-                self.wait_time(next_time)
-
-                self.run()
-                self.callback()
+                target = self.zero_time + next_time*self.sec_per_turn
+                self.zero_time = await wait.until(target)
+                self._fire(next_time, target)
         except Exception:
             print("Exception is MillisTaskQueue.loop:")
             traceback.print_exc()
+    def _fire(self, next_time, target):
+        "Catch up to `next_time` turns from now (due at real time `target`) and run everything"
+        stats = self.stats
+        if stats is not None:
+            stats.lateness.record((monotonic() - target) * 1000)
+        self.wait_time(next_time)
+
+        self.run()
+        if stats is None:
+            self.callback()
+        else:
+            start = perf_counter()
+            self.callback()
+            stats.callback_time.record((perf_counter() - start) * 1000)
     def schedule(self, func, delay, patience):
         if self.running != 0:
             # If we're in the middle of a task loop, schedule everything like normal, nothing need change
@@ -125,12 +147,130 @@ class MillisTaskQueue(TaskQueue):
         next_time = self.next_time()
         super().schedule(func, delay, patience)
         if delay < next_time:
-            self.async_task.cancel()
-            self.async_task = asyncio.create_task(self.loop())
+            self._restart()
+    def _restart(self):
+        "Make sure the loop notices the new earliest task"
+        self.async_task.cancel()
+        self.async_task = asyncio.create_task(self.loop())
     async def cancel(self):
         self.async_task.cancel()
 
+class TickTaskQueue(MillisTaskQueue):
+    """
+    MillisTaskQueue which only wakes up every `tick` turns,
+    so everything falling in the same tick runs as one batch (with one callback).
+    The loop task is started once and sticks around; when something gets
+    scheduled sooner than it was planning on, we just nudge it to set a new alarm.
+    """
+    def __init__(self, callback, sec_per_turn=0.001, tick=10):
+        self.tick = tick
+        self.wakeup = None
+        super().__init__(callback, sec_per_turn)
+        self.async_task = asyncio.create_task(self.loop())
+    def _push(self, task):
+        # Round up to the next tick
+        task.time = -(-task.time // self.tick) * self.tick
+        super()._push(task)
+    def _wake(self):
+        if self.wakeup is not None and not self.wakeup.done():
+            self.wakeup.set_result(None)
+    def _restart(self):
+        if self.async_task.done():
+            # Only if the loop died to an exception, otherwise it's still waiting on `wakeup`
+            super()._restart()
+        else:
+            self._wake()
+    async def loop(self):
+        aloop = asyncio.get_running_loop()
+        slept = False
+        try:
+            while True:
+                next_time = self.next_time()
+                when = self.zero_time + next_time*self.sec_per_turn
+                now = monotonic()
+                if now < when:
+                    self.wakeup = aloop.create_future()
+                    alarm = None
+                    if next_time != inf:
+                        alarm = aloop.call_later(when - now, self._wake)
+                    await self.wakeup
+                    if alarm is not None:
+                        alarm.cancel()
+                    slept = True
+                    continue
+
+                # Same as `wait.until`, if we had to sleep then assume we came out close enough
+                self.zero_time = when if slept else now
+                slept = False
+                self._fire(next_time, when)
+        except Exception:
+            print("Exception is TickTaskQueue.loop:")
+            traceback.print_exc()
+
+class Histogram:
+    "Tally of values bucketed by powers of two, for a rough idea of the distribution"
+    def __init__(self, unit=''):
+        self.unit = unit
+        self.buckets = {}
+        self.count = 0
+        self.total = 0
+        self.max = 0
+    def record(self, value):
+        self.count += 1
+        self.total += value
+        if value > self.max:
+            self.max = value
+        bound = 1
+        while bound < value:
+            bound *= 2
+        self.buckets[bound] = self.buckets.get(bound, 0) + 1
+    def __str__(self):
+        if not self.count:
+            return "(nothing yet)"
+        u = self.unit
+        buckets = ' '.join(f"<={b}{u}:{n}" for b, n in sorted(self.buckets.items()))
+        return f"n={self.count} mean={self.total/self.count:.2f}{u} max={self.max:.2f}{u} [{buckets}]"
+
+class QueueStats:
+    """
+    What a TaskQueue has been up to. Tasks are grouped by the name of their function,
+    which for bound methods includes the class name (e.g. `MagentaPlant.grow`).
+    Lateness and callback time are only recorded by MillisTaskQueues.
+    """
+    def __init__(self):
+        self.lateness = Histogram('ms')
+        self.callback_time = Histogram('ms')
+        self.tasks_per_run = Histogram()
+        self.by_patience = {}
+        self.by_func = {}
+        self.this_run = 0
+    def task_ran(self, task, secs):
+        self.this_run += 1
+        self.by_patience[task.patience] = self.by_patience.get(task.patience, 0) + 1
+        func = task.func
+        name = getattr(func, '__qualname__', None) or type(func).__qualname__
+        try:
+            h = self.by_func[name]
+        except KeyError:
+            h = Histogram('ms')
+            self.by_func[name] = h
+        h.record(secs * 1000)
+    def run_complete(self):
+        self.tasks_per_run.record(self.this_run)
+        self.this_run = 0
+    def describe(self):
+        lines = [
+            f"Tick lateness: {self.lateness}",
+            f"Frame callback: {self.callback_time}",
+            f"Tasks per run: {self.tasks_per_run}",
+            "Tasks by patience: " + ', '.join(f"{p}:{n}" for p, n in sorted(self.by_patience.items())),
+        ]
+        for name, h in sorted(self.by_func.items(), key = lambda x: -x[1].total):
+            lines.append(f"{name}: {h}")
+        return lines
+
 class Task:
+    __slots__ = ('func', 'time', 'patience')
     def __init__(self, func, time=0, patience=0):
         self.func = func
         self.time = time
@@ -16,10 +16,36 @@ def measure(v):
         return abs(x+y)
     return max(abs(x), abs(y))
 
-# This function lovingly constructed on graph paper!
+# Answers from `compute_angles`, by `angle_key`.
+# The lists are shared, so callers mustn't modify them!
+angle_table = {}
+
+def sign(a):
+    return (a > 0) - (a < 0)
+
+# `compute_angles` only cares which way `v1` points (on one of the 12 lines it
+# compares against, or between two of them), whether it's a unit vector, and `flip`.
+# So that's all we key on, and `angle_table` never gets bigger than a few dozen entries.
+def angle_key(v1, flip):
+    (x,y) = v1
+    return (sign(x), sign(y), sign(x+y), sign(x-y), sign(x+2*y), sign(2*x+y), measure(v1) == 1, sign(flip), flip == 1)
+
 # Returns a list of angles to try to reach that vector, in preference order.
 # Only returns angles that will reduce the "true" (euclidean) distance to the target.
 def calc_angles(v1, flip):
+    key = angle_key(v1, flip)
+    ret = angle_table.get(key)
+    if ret is None:
+        ret = angle_table[key] = compute_angles(v1, flip)
+    return ret
+
+def calc_angles_many(vs, flip):
+    "`calc_angles` for each of `vs`"
+    return [calc_angles(v, flip) for v in vs]
+
+# This function lovingly constructed on graph paper!
+# Use `calc_angles` instead, which remembers the answers.
+def compute_angles(v1, flip):
     if v1 == (0,0):
         return []
     (x,y)=v1
@@ -81,3 +107,57 @@ def display_dist(v):
     (x,y) = v
     return sqrt(x*(x + y) + y*y)
 
+
+## Bulk versions of the above, for when there's a whole board's worth of positions.
+## These inline the math instead of calling the single versions for each position.
+
+def measure_many(vs):
+    "`measure` for each of `vs`"
+    return [abs(x+y) if x*y >= 0 else max(abs(x), abs(y)) for (x,y) in vs]
+
+def display_dist_many(vs):
+    "`display_dist` for each of `vs`"
+    return [sqrt(x*(x + y) + y*y) for (x,y) in vs]
+
+def transform_many(vs, flip, rot):
+    "`transform` for each of `vs`"
+    (ax, ay) = units[rot]
+    (bx, by) = units[(rot+5)%6]
+    shear = (1-flip)//2
+    ret = []
+    for (x,y) in vs:
+        x = x + y*shear
+        y = y * flip
+        ret.append((ax*x + bx*y, ay*x + by*y))
+    return ret
+
+def ring(center, r):
+    "Positions exactly `r` steps (by `measure`) from `center`, in order going around"
+    if r == 0:
+        return [center]
+    (cx, cy) = center
+    # Start at one corner of the ring, then walk each side
+    (x, y) = mult(units[4], r)
+    ret = []
+    for (dx, dy) in units:
+        for _ in range(r):
+            ret.append((cx + x, cy + y))
+            x += dx
+            y += dy
+    return ret
+
+def disc(center, r):
+    "Positions within `r` steps (by `measure`) of `center`, nearest rings first"
+    ret = []
+    for i in range(r+1):
+        ret += ring(center, i)
+    return ret
+
+def neighbors_many(vs):
+    "Every position next to one of `vs`, not counting `vs` themselves"
+    vs = set(vs)
+    ret = set()
+    for (x,y) in vs:
+        for (dx, dy) in units:
+            ret.add((x + dx, y + dy))
+    return ret - vs
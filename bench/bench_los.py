@@ -0,0 +1,29 @@
+# Times `los_fill` against the old per-arc shadowcaster it replaced.
+# Run from the top of the repo with `python3 -m bench.bench_los`.
+import random
+import time
+
+from app.line_of_sight import los_fill
+from bench import reference_line_of_sight as reference
+from bench.maps import hex_map
+
+CASES = ((10, 0.05), (25, 0.1), (25, 0.3), (40, 0.15))
+SOURCES = 20
+
+def main():
+    for (radius, density) in CASES:
+        rnd = random.Random(radius)
+        cells, walls, opaque = hex_map(rnd, radius, density)
+        sources = rnd.sample(sorted(cells - walls), SOURCES)
+        times = {}
+        for name, fill in (('old', reference.los_fill), ('new', los_fill)):
+            # Don't count growing the offset table, that only happens once
+            fill(opaque, sources[0])
+            start = time.perf_counter()
+            for src in sources:
+                fill(opaque, src)
+            times[name] = (time.perf_counter() - start) * 1000 / SOURCES
+        print(f"radius {radius:2}, {density:.0%} walls: old {times['old']:6.2f} ms, new {times['new']:6.2f} ms, {times['old'] / times['new']:.1f}x")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,32 @@
+# How much memory a GrowGame board takes per tile, empty and with one ent each.
+# Run from the top of the repo with `python3 -m bench.bench_memory`.
+import asyncio
+import tracemalloc
+
+from app.game import SpriteEnt
+from app.games.grow import GrowGame
+
+SIZE = 200
+
+def allocated(since):
+    return sum(stat.size_diff for stat in tracemalloc.take_snapshot().compare_to(since, 'filename'))
+
+async def main():
+    game = GrowGame(None)
+    tiles = SIZE * SIZE
+    tracemalloc.start()
+    start = tracemalloc.take_snapshot()
+    for x in range(SIZE):
+        for y in range(SIZE):
+            game.board.require_tile((x, y))
+    empty = allocated(start)
+    start = tracemalloc.take_snapshot()
+    for i in range(tiles):
+        SpriteEnt("grass", game)._move((i // SIZE, i % SIZE))
+    full = allocated(start)
+    tracemalloc.stop()
+    print(f"{SIZE}x{SIZE} board: {empty / tiles:.1f} bytes per empty tile, {full / tiles:.1f} more per ent (including the tile's contents list)")
+    await game.cleanup()
+
+if __name__ == '__main__':
+    asyncio.run(main())
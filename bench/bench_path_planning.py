@@ -0,0 +1,32 @@
+# Compares `update_path` with the old greedy planner on random maps:
+# how long they take, how often they find a path, and how long the paths are.
+# Run from the top of the repo with `python3 -m bench.bench_path_planning`.
+import random
+import time
+
+from app.path_planning import update_path
+from bench import reference_path_planning as reference
+from bench.maps import random_case
+
+CASES = 5000
+
+def main():
+    rnd = random.Random(0)
+    cases = []
+    while len(cases) < CASES:
+        case = random_case(rnd)
+        if case[4](case[3]):
+            cases.append(case)
+    results = {}
+    for name, plan in (('old', reference.update_path), ('new', update_path)):
+        start = time.perf_counter()
+        results[name] = [plan(*case) for case in cases]
+        elapsed = (time.perf_counter() - start) * 1e6 / CASES
+        found = [path for path, case in zip(results[name], cases) if path is not case[1]]
+        print(f"{name}: {elapsed:6.1f} us/call, found {len(found)}/{CASES}, {sum(map(len, found)) / len(found):.2f} steps on average")
+    found_both = [(a, b) for a, b, case in zip(results['old'], results['new'], cases) if a is not case[1] and b is not case[1]]
+    shorter = sum(1 for a, b in found_both if len(b) < len(a))
+    print(f"Where both found a path, the new one was shorter {shorter}/{len(found_both)} times")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,45 @@
+# Random maps shared by the benchmarks and the tests.
+import random
+
+from app import vector as vec
+
+def hex_map(rnd, radius, density):
+    "A hexagon of cells with random walls; everything off the map is opaque too"
+    cells = {(x, y) for x in range(-radius, radius+1) for y in range(-radius, radius+1) if abs(x + y) <= radius}
+    walls = {c for c in cells if rnd.random() < density}
+    def opaque(p):
+        return p not in cells or p in walls
+    return cells, walls, opaque
+
+def random_maps(seed, count):
+    "`count` random hex maps (as from `hex_map`), each with a few places to look from"
+    rnd = random.Random(seed)
+    for _ in range(count):
+        cells, walls, opaque = hex_map(rnd, rnd.randrange(2, 14), rnd.random() * 0.5)
+        open_cells = sorted(cells - walls)
+        for _ in range(3):
+            src = rnd.choice(open_cells) if open_cells else (0, 0)
+            yield cells, opaque, src
+
+# How far from the middle `random_case` paths can go
+PATH_RADIUS = 8
+
+def random_case(rnd):
+    "A random hex map with some walls, and a random walk from the middle as the current path"
+    density = rnd.random() * 0.5
+    walls = {(x, y) for x in range(-PATH_RADIUS, PATH_RADIUS+1) for y in range(-PATH_RADIUS, PATH_RADIUS+1) if rnd.random() < density}
+    start = (0, 0)
+    walls.discard(start)
+    def traversable(p):
+        return p not in walls and vec.measure(p) <= PATH_RADIUS
+    max_len = rnd.randrange(1, 10)
+    l = []
+    pos = start
+    for _ in range(rnd.randrange(0, max_len + 1)):
+        d = rnd.randrange(6)
+        pos = vec.add(pos, vec.units[d])
+        if not traversable(pos):
+            break
+        l.append((pos, d))
+    dest = (rnd.randrange(-6, 7), rnd.randrange(-6, 7))
+    return start, l, max_len, dest, traversable
@@ -241,7 +241,41 @@ function set_status(input) {
 	status_area.replaceChildren(...newChildren);
 }
 
+// Sprite names by index, for binary arena updates
+let spriteNames = [];
+const BIN_ARENA = 1;
+
+// See the comment on BIN_ARENA in server.py for the format
+function process_binary(buffer) {
+	let view = new DataView(buffer);
+	let kind = view.getUint8(0);
+	if (kind != BIN_ARENA) {
+		alert("Unknown binary message kind " + kind);
+		return;
+	}
+	let count = view.getUint32(1, true);
+	let at = 5;
+	for (let i = 0; i < count; i++) {
+		let x = view.getInt32(at, true);
+		let y = view.getInt32(at + 4, true);
+		let ver = view.getInt8(at + 8);
+		let keep = view.getUint16(at + 9, true);
+		let n = view.getUint16(at + 11, true);
+		at += 13;
+		let add = [];
+		for (let j = 0; j < n; j++) {
+			add.push(spriteNames[view.getUint16(at, true)]);
+			at += 2;
+		}
+		update_tile(x, y, ver, keep, add);
+	}
+}
+
 function process_message(event) {
+	if (event.data instanceof ArrayBuffer) {
+		process_binary(event.data);
+		return;
+	}
 	let obj = JSON.parse(event.data);
 	if (obj.type == "foo") {
 		alert("woah");
@@ -265,6 +299,9 @@ function process_message(event) {
 		for (let item of obj.items) {
 			update_tile(item.x, item.y, item.ver, item.keep, item.add);
 		}
+	} else if (obj.type == "sprites") {
+		spriteNames.length = obj.first;
+		spriteNames.push(...obj.names);
 	} else if (obj.type == "status") {
 		set_status(obj.text);
 	} else {
@@ -277,9 +314,11 @@ function handle_close(event) {
 }
 
 let ws = new WebSocket(`ws://${window.location.hostname}:15000`);
+ws.binaryType = 'arraybuffer';
 ws.onmessage = process_message;
 ws.onclose = handle_close;
-ws.onopen = () => { ws.send("/name " + (localStorage.name || "")); }
+// Anything after the name is a list of options, one per line
+ws.onopen = () => { ws.send("/name " + (localStorage.name || "") + "\nbinary"); }
 
 document.getElementById('form').onsubmit = function () {
 	const msg = input_area.value;
@@ -6,4 +6,8 @@
 # stream-lined; this file just being an import is so that everything else
 # can use relative packages.
 import app
-app.server.launch()
+
+# Worker processes re-import this file when they don't fork (e.g. with the spawn start method),
+# and they mustn't try to launch everything all over again
+if __name__ == "__main__":
+    app.server.launch()
@@ -0,0 +1,70 @@
+import random
+
+from app.board import Tile, WatchyTile, Board, ChunkedBoard, NO_CONTENTS, NO_WATCHERS, changed_positions
+from app.game import Game, SpriteEnt
+
+class Watcher:
+    def __init__(self):
+        self.updates = 0
+    def tile_update(self):
+        self.updates += 1
+
+def test_sentinels_after_add_rm():
+    rnd = random.Random(0)
+    tiles = [WatchyTile() for _ in range(5)] + [Tile() for _ in range(5)]
+    model = [[] for _ in tiles]
+    for i in range(2000):
+        ix = rnd.randrange(len(tiles))
+        tile = tiles[ix]
+        if model[ix] and rnd.random() < 0.5:
+            ent = rnd.choice(model[ix])
+            model[ix].remove(ent)
+            tile.rm(ent)
+        else:
+            model[ix].append(i)
+            tile.add(i)
+        assert list(tile.contents) == model[ix]
+        if not model[ix]:
+            assert tile.contents is NO_CONTENTS
+    for tile in tiles[:5]:
+        watchers = [Watcher() for _ in range(3)]
+        for _ in range(3):
+            for w in watchers:
+                tile.add_watcher(w)
+            tile.add(-1)
+            tile.rm(-1)
+            for w in watchers:
+                tile.rm_watcher(w)
+            assert tile.watchers is NO_WATCHERS
+        assert all(w.updates == 6 for w in watchers)
+    assert NO_CONTENTS == () and NO_WATCHERS == ()
+
+def test_sentinels_after_snapshots():
+    rnd = random.Random(1)
+    game = Game(None)
+    ents = [SpriteEnt(f"s{i}", game) for i in range(30)]
+    for step in range(50):
+        for ent in rnd.sample(ents, 10):
+            ent._move(None if rnd.random() < 0.3 else (rnd.randrange(6), rnd.randrange(6)))
+        game.step_complete()
+        snapshot = game.get_snapshot()
+        full = ChunkedBoard()
+        game.draw_to_board(full)
+        assert changed_positions(snapshot, full) == set()
+        for pos, tile in snapshot.items():
+            if not tile.contents:
+                assert tile.contents is NO_CONTENTS
+    assert NO_CONTENTS == ()
+
+def test_changed_positions():
+    a = Board(width = 3, height = 3)
+    b = ChunkedBoard()
+    assert changed_positions(a, b) == set()
+    a.require_tile((1, 1)).add("x")
+    b.require_tile((2, 2)).add("x")
+    assert changed_positions(a, b) == {(1, 1), (2, 2)}
+    # An emptied tile is the same as one that was never there
+    b.require_tile((1, 1)).contents = []
+    b.require_tile((2, 2)).rm("x")
+    a.get_tile((1, 1)).rm("x")
+    assert changed_positions(a, b) == set()
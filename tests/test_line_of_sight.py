@@ -0,0 +1,81 @@
+import random
+
+from app import vector as vec, line_of_sight
+from app.line_of_sight import los_fill, los_fill_many, visible_from, merge_visibility
+from bench import reference_line_of_sight as reference
+from bench.maps import hex_map, random_maps
+
+def test_matches_reference():
+    # Cells come out in a different order now, but it should be the same cells with the same visibility
+    for _, opaque, src in random_maps(0, 300):
+        assert sorted(los_fill(opaque, src)) == sorted(reference.los_fill(opaque, src))
+
+def test_open_field():
+    rnd = random.Random(1)
+    cells, _, opaque = hex_map(rnd, 6, 0)
+    got = los_fill(opaque, (0, 0))
+    assert sorted(got) == sorted(reference.los_fill(opaque, (0, 0)))
+    assert {p for p, v in got if v == 3} >= cells
+
+def test_bounds_are_opaque():
+    rnd = random.Random(2)
+    for _ in range(100):
+        (w, h) = (rnd.randrange(1, 12), rnd.randrange(1, 12))
+        walls = {(x, y) for x in range(w) for y in range(h) if rnd.random() < 0.2}
+        src = (rnd.randrange(w), rnd.randrange(h))
+        walls.discard(src)
+        inside = lambda p: 0 <= p[0] < w and 0 <= p[1] < h
+        expected = los_fill(lambda p: not inside(p) or p in walls, src)
+        asked = []
+        def occlude(p):
+            asked.append(p)
+            return p in walls
+        got = los_fill(occlude, src, bounds=(0, 0, w, h))
+        assert sorted(got) == sorted(expected)
+        assert all(inside(p) for p in asked)
+
+def test_max_radius():
+    for _, opaque, src in random_maps(3, 100):
+        full = los_fill(opaque, src)
+        for radius in (1, 2.5, 4):
+            got = los_fill(opaque, src, max_radius=radius)
+            near = [(p, v) for p, v in full if vec.display_dist(vec.sub(p, src)) <= radius]
+            assert sorted(got) == sorted(near)
+
+def test_many_sources():
+    rnd = random.Random(4)
+    cells, walls, opaque = hex_map(rnd, 8, 0.2)
+    sources = rnd.sample(sorted(cells - walls), 5)
+    calls = {}
+    def occlude(p):
+        calls[p] = calls.get(p, 0) + 1
+        return opaque(p)
+    many = los_fill_many(occlude, sources + sources[:1])
+    assert all(n == 1 for n in calls.values())
+    combined = {}
+    for src in sources:
+        single = {}
+        merge_visibility(single, los_fill(opaque, src))
+        assert many[src] == single
+        merge_visibility(combined, single.items())
+    assert visible_from(opaque, sources) == combined
+
+def test_merge_visibility():
+    visible = {(0, 0): 1, (1, 0): 3}
+    merge_visibility(visible, [((0, 0), 3), ((1, 0), 1), ((2, 0), 1), ((2, 0), 3)])
+    assert visible == {(0, 0): 3, (1, 0): 3, (2, 0): 3}
+
+def test_offset_table():
+    (entries, final) = line_of_sight.get_offset_table(500)
+    assert final > 500
+    # The final part is exactly every offset that close, nearest first
+    limit = entries[final - 1][0]
+    expected = sorted((vec.display_dist(v), v) for v in vec.disc((0, 0), 40) if vec.display_dist(v) <= limit)
+    assert [(e[0], e[1]) for e in entries[:final]] == expected
+    for e in entries:
+        assert line_of_sight.lookup_offset(e[1]) is e
+    (distance, offset, pair, lo, hi, inner_pair, around) = line_of_sight.lookup_offset((3, -1))
+    assert distance == vec.display_dist((3, -1))
+    assert pair == line_of_sight.get_visual_extent((3, -1))
+    assert inner_pair == line_of_sight.get_visual_extent((9, -3))
+    assert around == tuple(vec.add((3, -1), u) for u in vec.units)
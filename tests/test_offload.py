@@ -0,0 +1,43 @@
+import asyncio
+import threading
+
+from app import offload
+from app.offload import Offloader
+
+def square(x):
+    return x * x
+
+def square_on_main_thread(x):
+    # Stands in for a computation the executor can't run (e.g. a pool that can't start)
+    if threading.current_thread() is not threading.main_thread():
+        raise RuntimeError("not here")
+    return x * x
+
+def run_offloader(mode, submissions):
+    async def body():
+        offload.configure(mode, 2)
+        try:
+            results = []
+            o = Offloader()
+            for compute, x in submissions:
+                if compute is None:
+                    o.skip(x, results.append)
+                else:
+                    o.submit(compute, (x,), results.append)
+            while o.task is not None:
+                await asyncio.sleep(0.001)
+            return results
+        finally:
+            offload.configure('none')
+    return asyncio.run(body())
+
+def test_inline():
+    assert run_offloader('none', [(square, 2), (None, 5), (square, 3)]) == [4, 5, 9]
+
+def test_latest_wins():
+    # The first one is already running; of the rest, only the last is still wanted
+    assert run_offloader('thread', [(square, 2), (square, 3), (None, 5), (square, 4)]) == [4, 16]
+    assert run_offloader('thread', [(square, 2), (square, 3), (None, 5)]) == [4, 5]
+
+def test_falls_back_to_inline():
+    assert run_offloader('thread', [(square_on_main_thread, 3), (square_on_main_thread, 4)]) == [9, 16]
@@ -0,0 +1,84 @@
+import random
+from collections import deque
+
+from app import vector as vec
+from app.path_planning import update_path
+from bench.maps import random_case
+
+def steps_to(pos, dest, limit, traversable):
+    "Breadth-first search; fewest steps from `pos` to `dest`, or None if it's more than `limit`"
+    seen = {pos: 0}
+    queue = deque([pos])
+    while len(queue) > 0:
+        p = queue.popleft()
+        if p == dest:
+            return seen[p]
+        if seen[p] == limit:
+            continue
+        for u in vec.units:
+            n = vec.add(p, u)
+            if n not in seen and traversable(n):
+                seen[n] = seen[p] + 1
+                queue.append(n)
+    return None
+
+def shortest(start, l, max_len, dest, traversable):
+    "For each number of steps of `l` we could keep, the shortest total path that keeps them"
+    ret = {}
+    for kept in range(len(l) + 1):
+        pos = start if kept == 0 else l[kept-1][0]
+        rest = steps_to(pos, dest, max_len - kept, traversable)
+        if rest is not None:
+            ret[kept] = kept + rest
+    return ret
+
+def test_against_oracle():
+    rnd = random.Random(0)
+    reachable = 0
+    for _ in range(2000):
+        (start, l, max_len, dest, traversable) = random_case(rnd)
+        if not traversable(dest):
+            continue
+        options = shortest(start, l, max_len, dest, traversable)
+        path = update_path(start, l, max_len, dest, traversable)
+        if len(options) == 0:
+            assert path is l
+            continue
+        reachable += 1
+        # As short as possible, and never too long
+        best = min(options.values())
+        assert len(path) == best <= max_len
+        # Keeps as much of `l` as any other shortest path could
+        most_kept = max(kept for kept, length in options.items() if length == best)
+        assert path[:most_kept] == l[:most_kept]
+        # And is actually a path
+        pos = start
+        for i, (p, d) in enumerate(path):
+            assert vec.add(pos, vec.units[d]) == p
+            assert (i < len(l) and path[i] == l[i]) or traversable(p)
+            pos = p
+        assert pos == dest
+    assert reachable > 500
+
+def test_walks_around_walls():
+    # A wall straight across the way, with a gap at one end
+    walls = {(2, y) for y in range(-3, 3)}
+    traversable = lambda p: p not in walls and vec.measure(p) <= 5
+    path = update_path((0, 0), [], 20, (4, 0), traversable)
+    assert len(path) == steps_to((0, 0), (4, 0), 20, traversable)
+    assert path[-1][0] == (4, 0)
+    assert all(p not in walls for p, _ in path)
+
+def test_unreachable_returns_l():
+    walls = {vec.add((3, 0), u) for u in vec.units}
+    traversable = lambda p: p not in walls
+    l = [((1, 0), 0)]
+    assert update_path((0, 0), l, 20, (3, 0), traversable) is l
+    # Reachable, but not in time
+    assert update_path((0, 0), l, 2, (4, 0), lambda p: True) is l
+
+def test_already_there():
+    l = [((1, 0), 0), ((2, 0), 0)]
+    assert update_path((0, 0), l, 5, (2, 0), lambda p: True) == l
+    assert update_path((0, 0), l, 5, (1, 0), lambda p: True) == l[:1]
+    assert update_path((0, 0), l, 5, (0, 0), lambda p: True) == []
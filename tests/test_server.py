@@ -0,0 +1,46 @@
+import json
+
+import pytest
+
+from app.server import parse_args
+
+def write_config(tmp_path, config):
+    path = tmp_path / "config.json"
+    path.write_text(json.dumps(config))
+    return str(path)
+
+def test_config_file(tmp_path):
+    path = write_config(tmp_path, {"port": 15001, "max-fps": 12, "offload": "thread", "deflate_no_context_takeover": True, "deflate-level": None})
+    args = parse_args(["--config", path])
+    assert (args.port, args.max_fps, args.offload, args.deflate_no_context_takeover, args.deflate_level) == (15001, 12.0, 'thread', True, None)
+    # The command line wins
+    args = parse_args(["--config", path, "--port", "15005"])
+    assert args.port == 15005
+
+@pytest.mark.parametrize('config', [
+    {"offload": "bogus"},
+    {"max_fps": -3},
+    {"port": "nope"},
+    {"port": True},
+    {"deflate-level": 12},
+    {"compression": ["none"]},
+    {"deflate_no_context_takeover": "yes"},
+    {"no_such_option": 1},
+    {"config": "other.json"},
+])
+def test_config_is_checked_like_the_command_line(tmp_path, config):
+    with pytest.raises(SystemExit):
+        parse_args(["--config", write_config(tmp_path, config)])
+
+def test_command_line_is_checked():
+    with pytest.raises(SystemExit):
+        parse_args(["--max-queued", "-1"])
+    with pytest.raises(SystemExit):
+        parse_args(["--deflate-window-bits", "7"])
+    with pytest.raises(SystemExit):
+        parse_args(["--offload-workers", "0"])
+
+def test_process_offload_needs_one_process():
+    assert parse_args(["--workers", "2", "--offload", "thread"]).offload == 'thread'
+    with pytest.raises(SystemExit):
+        parse_args(["--workers", "2", "--offload", "process"])
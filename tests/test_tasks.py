@@ -0,0 +1,92 @@
+import asyncio
+
+from app.tasks import TaskQueue, TickTaskQueue, Task, NO_PATIENCE, ACT_PATIENCE, SLOW_PATIENCE
+
+# These pin down the order tasks run in, which games depend on
+# for fairness (e.g. who gets to claim a tile first).
+
+def recorder():
+    order = []
+    def mk(name, then = None):
+        def f():
+            order.append(name)
+            if then is not None:
+                then()
+        return f
+    return order, mk
+
+def test_same_time_fifo():
+    q = TaskQueue()
+    order, mk = recorder()
+    for name in "abcde":
+        q.schedule(mk(name), 5, ACT_PATIENCE)
+    q.schedule(mk("later"), 6, ACT_PATIENCE)
+    q.wait_time(5)
+    q.run()
+    assert order == list("abcde")
+    q.wait_time(1)
+    q.run()
+    assert order == list("abcde") + ["later"]
+
+def test_zero_delay_from_outside_is_newest_first():
+    q = TaskQueue()
+    order, mk = recorder()
+    q.schedule(mk("delayed"), 3, NO_PATIENCE)
+    q.wait_time(3)
+    # Not running, so these go to `pending`, ahead of anything else due now
+    q.schedule(mk("a"), 0, NO_PATIENCE)
+    q.schedule(mk("b"), 0, NO_PATIENCE)
+    q.schedule(mk("c"), 0, NO_PATIENCE)
+    q.run()
+    assert order == ["c", "b", "a", "delayed"]
+
+def test_zero_patience_joins_running_batch():
+    q = TaskQueue()
+    order, mk = recorder()
+    def a():
+        order.append("a")
+        q.schedule(mk("slow"), 0, SLOW_PATIENCE)
+        q.schedule(mk("same batch"), 0, 0)
+        q.schedule(mk("next batch"), 0, NO_PATIENCE)
+    q.schedule(a, 1, NO_PATIENCE)
+    q.schedule(mk("b"), 1, NO_PATIENCE)
+    q.wait_time(1)
+    q.run()
+    assert order == ["a", "b", "same batch", "next batch", "slow"]
+
+def test_patience_order_within_run():
+    q = TaskQueue()
+    order, mk = recorder()
+    q.schedule(mk("slow"), 2, SLOW_PATIENCE)
+    q.schedule(mk("act"), 2, ACT_PATIENCE)
+    q.schedule(mk("write"), 2, NO_PATIENCE)
+    q.wait_time(2)
+    q.run()
+    assert order == ["write", "act", "slow"]
+
+def test_patience_at_least_running_is_deferred():
+    q = TaskQueue()
+    order, mk = recorder()
+    def a():
+        order.append("a")
+        # Too patient for this run, so it waits in `pending` like the others
+        q.schedule(mk("deferred new"), 0, ACT_PATIENCE)
+    q.schedule(a, 4, NO_PATIENCE)
+    q.schedule(mk("deferred"), 4, ACT_PATIENCE)
+    q.schedule(mk("deferred slow"), 4, SLOW_PATIENCE)
+    q.wait_time(4)
+    q.run(ACT_PATIENCE)
+    assert order == ["a"]
+    assert q.next_time() == 0
+    q.run()
+    # The deferred tasks kept their place in line; the new zero-delay one went to the front
+    assert order == ["a", "deferred new", "deferred", "deferred slow"]
+
+def test_tick_rounding():
+    async def body():
+        q = TickTaskQueue(lambda: None, tick=10)
+        for time in (1, 10, 13, 20, 21):
+            q._push(Task(None, time, NO_PATIENCE))
+        assert sorted(entry[0] for entry in q.pending) == [10, 10, 20, 20, 30]
+        await q.cancel()
+    asyncio.run(body())
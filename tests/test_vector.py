@@ -0,0 +1,63 @@
+from app import vector as vec
+
+N = 150
+FLIPS = (1, -1, 3, -3)
+
+def square(n):
+    return [(x, y) for x in range(-n, n+1) for y in range(-n, n+1)]
+
+def test_calc_angles_matches_compute_angles():
+    vs = square(N)
+    for flip in FLIPS:
+        for v in vs:
+            assert vec.calc_angles(v, flip) == vec.compute_angles(v, flip), (v, flip)
+        assert vec.calc_angles_many(vs, flip) == [vec.compute_angles(v, flip) for v in vs]
+
+def test_angle_table_stays_small():
+    for flip in FLIPS:
+        vec.calc_angles_many(square(40), flip)
+    # 12 lines + 12 gaps between them, a few unit vectors, and a handful of `flip`s
+    assert len(vec.angle_table) <= 24 * 2 * len(FLIPS)
+
+def test_display_dist_many():
+    vs = square(10)
+    assert vec.display_dist_many(vs) == [vec.display_dist(v) for v in vs]
+
+def test_ring():
+    for center in ((0, 0), (3, -7)):
+        for r in range(8):
+            got = vec.ring(center, r)
+            expected = {vec.add(center, v) for v in square(r) if vec.measure(v) == r}
+            assert len(got) == len(expected) and set(got) == expected
+            # Goes around in order, each one next to the last
+            for a, b in zip(got, got[1:] + got[:1]):
+                assert r == 0 or vec.sub(b, a) in vec.units
+
+def test_measure_many():
+    vs = square(10)
+    assert vec.measure_many(vs) == [vec.measure(v) for v in vs]
+
+def test_transform_many():
+    vs = square(5)
+    for flip in (1, -1, 3, -3):
+        for rot in range(6):
+            assert vec.transform_many(vs, flip, rot) == [vec.transform(v, flip, rot) for v in vs]
+
+def test_disc():
+    for center in ((0, 0), (-4, 2)):
+        for r in range(6):
+            got = vec.disc(center, r)
+            expected = {vec.add(center, v) for v in square(r) if vec.measure(v) <= r}
+            assert len(got) == len(expected) and set(got) == expected
+            assert vec.measure_many([vec.sub(p, center) for p in got]) == sorted(vec.measure_many([vec.sub(p, center) for p in got]))
+
+def test_neighbors_many():
+    assert vec.neighbors_many([]) == set()
+    assert vec.neighbors_many([(2, 3)]) == {vec.add((2, 3), u) for u in vec.units}
+    # Growing a disc by one step gives the next ring out
+    for r in range(5):
+        assert vec.neighbors_many(vec.disc((1, 1), r)) == set(vec.ring((1, 1), r + 1))
+    # Overlapping and repeated positions
+    vs = [(0, 0), (1, 0), (1, 0)]
+    expected = {vec.add(v, u) for v in vs for u in vec.units} - set(vs)
+    assert vec.neighbors_many(vs) == expected